@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Leveled, asynchronous logging for the game.
+
+Log calls only put the record on a queue; a background thread formats the
+messages and writes them to a rotating log file (and the console). Messages
+use lazy %-style arguments, so a call below the configured level costs one
+level check, and records that are logged are formatted off the GUI thread.
+
+Modules get their logger with logging.getLogger('msmd.<name>').
+"""
+
+import os
+import queue
+import logging
+import logging.handlers
+
+
+LOGGER_NAME = 'msmd'
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # QueueHandler formats the message in the logging thread; leave that to the listener
+
+    def prepare(self, record):
+        return record
+
+
+def setupLogging(level='info', logFolder='', maxBytes=1024*1024, backupCount=3, console=True):
+    # returns the listener, which has to be stopped on exit to flush the queue
+    handlers = []
+    formatter = logging.Formatter(LOG_FORMAT)
+    if logFolder:
+        try:
+            os.makedirs(logFolder, exist_ok=True)
+            fileHandler = logging.handlers.RotatingFileHandler(os.path.join(logFolder, 'msmd.log'), maxBytes=maxBytes, backupCount=backupCount)
+            fileHandler.setFormatter(formatter)
+            handlers.append(fileHandler)
+        except OSError as error:
+            print('ERROR - log file could not be opened: %s' % error)
+    if console or not handlers:
+        consoleHandler = logging.StreamHandler()
+        consoleHandler.setFormatter(formatter)
+        handlers.append(consoleHandler)
+
+    logQueue = queue.Queue(-1)
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(getattr(logging, level.upper(), logging.INFO))
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_DeferredQueueHandler(logQueue))
+    listener = logging.handlers.QueueListener(logQueue, *handlers)
+    listener.start()
+    return listener
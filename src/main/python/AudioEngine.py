@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Low latency sound playback with one long-lived output stream.
+
+WAV files are decoded once into in-memory buffers of a common sample format
+(16 bit, stereo, 44.1 kHz). Playing a sound only adds it to the list of
+active voices; the stream callback mixes all active voices into the output,
+so overlapping sounds are mixed instead of each needing its own thread and
+audio device.
+
+SoundCache decodes all the sounds of a level when the level is loaded and
+keeps the sounds of recently played levels within a memory budget, so step
+transitions never have to touch the file system for audio.
+"""
+
+import wave
+import audioop
+import logging
+import threading
+from collections import OrderedDict
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+
+log = logging.getLogger('msmd.audio')
+
+
+SAMPLE_WIDTH = 2
+CHANNELS = 2
+RATE = 44100
+FRAMES_PER_BUFFER = 512
+MAX_VOICES = 8
+
+
+def decodeWave(source):
+    # source is a file name or a file object; returns 16 bit stereo 44.1 kHz samples
+    waveFile = wave.open(source, 'rb')
+    try:
+        sampleWidth = waveFile.getsampwidth()
+        channels = waveFile.getnchannels()
+        rate = waveFile.getframerate()
+        samples = waveFile.readframes(waveFile.getnframes())
+    finally:
+        waveFile.close()
+    if sampleWidth == 1:
+        # 8 bit wav files are unsigned
+        samples = audioop.bias(samples, 1, -128)
+    if sampleWidth != SAMPLE_WIDTH:
+        samples = audioop.lin2lin(samples, sampleWidth, SAMPLE_WIDTH)
+    if channels > 2:
+        raise ValueError('only mono and stereo wav files are supported')
+    if rate != RATE:
+        samples, _ = audioop.ratecv(samples, SAMPLE_WIDTH, channels, rate, RATE, None)
+    if channels == 1:
+        samples = audioop.tostereo(samples, SAMPLE_WIDTH, 1, 1)
+    return samples
+
+
+class AudioEngine(object):
+
+    def __init__(self, openOutput=True):
+        # without an output (openOutput=False) sounds are accepted and dropped
+        self.lock = threading.Lock()
+        self.voices = []  # [samples, position] of the sounds being played
+        self.bufferBytes = FRAMES_PER_BUFFER*CHANNELS*SAMPLE_WIDTH
+        self.silence = bytes(self.bufferBytes)
+        self.audio = None
+        self.stream = None
+        if not openOutput:
+            return
+        if pyaudio is None:
+            log.error('pyaudio is not available, sounds will not be played')
+            return
+        try:
+            self.audio = pyaudio.PyAudio()
+            self.stream = self.audio.open(format=self.audio.get_format_from_width(SAMPLE_WIDTH),
+                                          channels=CHANNELS,
+                                          rate=RATE,
+                                          output=True,
+                                          frames_per_buffer=FRAMES_PER_BUFFER,
+                                          stream_callback=self.streamCallback)
+        except Exception as error:
+            log.error('could not open the audio output, sounds will not be played: %s', error)
+            self.close()
+
+    def play(self, samples):
+        if self.stream is None:
+            return
+        with self.lock:
+            if len(self.voices) >= MAX_VOICES:
+                self.voices.pop(0)
+            self.voices.append([samples, 0])
+
+    def streamCallback(self, inData, frameCount, timeInfo, status):
+        # runs on the audio thread
+        numBytes = frameCount*CHANNELS*SAMPLE_WIDTH
+        output = self.silence if numBytes == self.bufferBytes else bytes(numBytes)
+        with self.lock:
+            for voice in self.voices:
+                samples, position = voice
+                chunk = samples[position:position+numBytes]
+                if len(chunk) < numBytes:
+                    chunk += bytes(numBytes-len(chunk))
+                output = audioop.add(output, chunk, SAMPLE_WIDTH)
+                voice[1] = position+numBytes
+            self.voices = [voice for voice in self.voices if voice[1] < len(voice[0])]
+        return (output, pyaudio.paContinue)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
+
+
+class SoundCache(object):
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.levels = OrderedDict()  # level folder -> {sound number: samples}
+        self.levelBytes = {}
+
+    def loadLevel(self, levelFolder, findSoundSources):
+        # findSoundSources returns a dict of sound numbers to wav file names (or
+        # file objects); it is only called if the level's sounds are not cached
+        sounds = self.levels.get(levelFolder)
+        if sounds is not None:
+            self.levels.move_to_end(levelFolder)
+            return sounds
+        sounds = {}
+        for soundNumber, source in findSoundSources().items():
+            try:
+                sounds[soundNumber] = decodeWave(source)
+            except (IOError, EOFError, ValueError, wave.Error) as error:
+                log.error('could not load sound %s of %s: %s', soundNumber, levelFolder, error)
+        self.levels[levelFolder] = sounds
+        self.levelBytes[levelFolder] = sum(len(samples) for samples in sounds.values())
+        self.currentBytes += self.levelBytes[levelFolder]
+        # the sounds of the level being loaded are kept even if they alone go over the budget
+        while self.currentBytes > self.maxBytes and len(self.levels) > 1:
+            self.invalidateLevel(next(iter(self.levels)))
+        return sounds
+
+    def invalidateLevel(self, levelFolder):
+        if self.levels.pop(levelFolder, None) is not None:
+            self.currentBytes -= self.levelBytes.pop(levelFolder)
+
+    def stats(self):
+        return {'levels': len(self.levels),
+                'bytes': self.currentBytes,
+                'maxBytes': self.maxBytes}
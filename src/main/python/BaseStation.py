@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Discovery and non-blocking power command writer for the robot base stations.
+
+PortMonitor enumerates the serial ports on a background thread, opens newly
+plugged in base stations and reports stations that were unplugged, so the
+game can attach and detach them while it is running without reopening the
+stations that are already connected.
+
+Every base station gets its own writer thread, so a station (or USB adapter)
+that stalls only delays its own commands and writes to several stations run
+in parallel. Power commands are coalesced: a command that has not been sent
+yet is replaced by a newer one, since only the latest power level matters.
+"""
+
+import time
+import logging
+import threading
+import serial
+import serial.tools.list_ports
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+log = logging.getLogger('msmd.basestation')
+
+
+UPGRADE_MODES = ('left', 'right', 'both', 'distance')
+
+
+def powerCommand(leftPower, rightPower):
+    return bytes([0, 0, leftPower, rightPower])+b'\n'
+
+
+def interpolate(inputValue, inputMin, inputMax, outputMin, outputMax):
+    ratio = (inputValue - inputMin)/(inputMax - inputMin)
+    outputValue = (outputMax - outputMin) * ratio + outputMin
+    return outputValue
+
+
+def motorPowers(powerLevel, mode, minPower, maxPower):
+    # turns the game's power level (0-100) into the left and right motor power of the upgrade mode
+    if(powerLevel > 100):
+        raise ValueError('powerLevel cannot be set above 100')
+    if(powerLevel < 0):
+        raise ValueError('powerLevel cannot be set below 0')
+    leftPower = minPower
+    rightPower = minPower
+    if(mode == "left"):
+        if(powerLevel <= 50):
+            leftPower = interpolate(powerLevel, 0, 100, minPower, maxPower)
+            rightPower = interpolate(powerLevel, 0, 50, minPower, maxPower)
+        else:
+            leftPower = interpolate(powerLevel, 0, 100, minPower, maxPower)
+            rightPower = interpolate(powerLevel, 50, 100, minPower, maxPower)
+    elif(mode == "right"):
+        if(powerLevel <= 50):
+            rightPower = interpolate(powerLevel, 0, 100, minPower, maxPower)
+            leftPower = interpolate(powerLevel, 0, 50, minPower, maxPower)
+        else:
+            rightPower = interpolate(powerLevel, 0, 100, minPower, maxPower)
+            leftPower = interpolate(powerLevel, 50, 100, minPower, maxPower)
+    elif(mode == "both"):
+        leftPower = interpolate(powerLevel, 0, 100, minPower, maxPower)
+        rightPower = leftPower
+    elif(mode == "distance"):
+        # add fuel to the robot "tank"
+        pass
+    else:
+        raise ValueError('upgradeMode in config.ini does not match any accepted value')
+    return int(leftPower), int(rightPower)
+
+
+def findBaseStationPorts():
+    # the base stations use Silicon Labs usb to serial adapters
+    comPortsList = []
+    for port in serial.tools.list_ports.comports():
+        if 'Silicon Labs' in str(port[1]):
+            comPortsList.append(port[0])
+    return comPortsList
+
+
+def openBaseStation(port):
+    # a stalled station only blocks its own writer thread for write_timeout
+    return serial.Serial(port, baudrate=115200, timeout=0.05, write_timeout=0.5)
+
+
+class PortMonitor(QThread):
+    stationAttached = pyqtSignal(str, 'PyQt_PyObject')
+    stationDetached = pyqtSignal(str)
+
+    def __init__(self, findPorts=findBaseStationPorts, interval=2.0, openPort=openBaseStation):
+        super().__init__()
+        self.findPorts = findPorts
+        self.openPort = openPort
+        self.interval = interval
+        self.attachedPorts = set()
+        self.wakeEvent = threading.Event()
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.scan()
+            self.wakeEvent.wait(self.interval)
+            self.wakeEvent.clear()
+
+    def scan(self):
+        try:
+            ports = set(self.findPorts())
+        except Exception as error:
+            log.error('could not list serial ports: %s', error)
+            return
+        for port in sorted(self.attachedPorts-ports):
+            self.attachedPorts.discard(port)
+            self.stationDetached.emit(port)
+        for port in sorted(ports-self.attachedPorts):
+            try:
+                baseStation = self.openPort(port)
+            except (serial.SerialException, OSError) as error:
+                # tried again on the next scan
+                log.warning('could not open base station %s: %s', port, error)
+                continue
+            self.attachedPorts.add(port)
+            self.stationAttached.emit(port, baseStation)
+
+    def rescan(self):
+        self.wakeEvent.set()
+
+    def stop(self):
+        self.running = False
+        self.wakeEvent.set()
+        self.wait()
+
+
+class BaseStationWriter(object):
+
+    def __init__(self, baseStation, repeat=2):
+        self.baseStation = baseStation
+        self.repeat = repeat  # every command is sent more than once in case a frame is lost
+        self.condition = threading.Condition()
+        self.pendingCommand = None
+        self.pendingSince = 0
+        self.running = True
+        self.writing = False
+        self.sent = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.lastLatency = 0
+        self.maxLatency = 0
+        self.totalLatency = 0
+        self.thread = threading.Thread(target=self.run, name='BaseStationWriter %s' % baseStation.port)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def send(self, command):
+        with self.condition:
+            if self.pendingCommand is not None:
+                self.coalesced += 1
+            else:
+                self.pendingSince = time.perf_counter()
+            self.pendingCommand = command
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pendingCommand is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                command = self.pendingCommand
+                queuedAt = self.pendingSince
+                self.pendingCommand = None
+                self.writing = True
+            try:
+                for _ in range(self.repeat):
+                    self.baseStation.write(command)
+                failed = False
+            except (serial.SerialException, OSError) as error:
+                log.error('could not write to base station %s: %s', self.baseStation.port, error)
+                failed = True
+            latency = time.perf_counter()-queuedAt
+            with self.condition:
+                self.writing = False
+                if failed:
+                    self.errors += 1
+                else:
+                    self.sent += 1
+                    self.lastLatency = latency
+                    self.maxLatency = max(self.maxLatency, latency)
+                    self.totalLatency += latency
+
+    def queueDepth(self):
+        with self.condition:
+            return self.unlockedQueueDepth()
+
+    def unlockedQueueDepth(self):
+        # commands waiting to be written (a coalesced command counts once)
+        return int(self.pendingCommand is not None)+int(self.writing)
+
+    def stop(self, timeout=1.0):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout)
+
+    def stats(self):
+        with self.condition:
+            return {'port': self.baseStation.port,
+                    'queueDepth': self.unlockedQueueDepth(),
+                    'sent': self.sent,
+                    'coalesced': self.coalesced,
+                    'errors': self.errors,
+                    'lastLatency': self.lastLatency,
+                    'maxLatency': self.maxLatency,
+                    'meanLatency': self.totalLatency/self.sent if self.sent else 0}
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Virtual base stations on pseudo terminals, for testing without the robots.
+
+usage: python BaseStationSimulator.py [--stations N] [--updates N] [--rate HZ]
+                                      [--latency S] [--baudrate B]
+                                      [--stall-probability P] [--stall-time S]
+                                      [--disconnects N] [--output FILE]
+
+Every virtual station is a pty: the game opens the slave side like any
+serial port (openBaseStation), and the station reads the master side,
+decodes the power frames (4 bytes and a newline, see powerCommand) and
+records when each frame arrived. Pass simulator.findPorts to App (or to
+PortMonitor or RaceServer) and the virtual stations are found instead of
+the Silicon Labs adapters. Stations can be made slow (latency per frame or
+a simulated baud rate), stall now and then (they stop reading, so the
+writes back up like on a stuck USB adapter) or be unplugged (disconnect).
+
+Run as a script, the simulator drives the stations through BaseStationWriter
+the way the game does, sending power updates at the given rate to every
+station, and prints the command throughput and the end-to-end latency from
+the send call until the frame was read by the station as json. This only
+works where pseudo terminals exist (Linux and macOS).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import select
+import logging
+import argparse
+import threading
+from BaseStation import BaseStationWriter, openBaseStation, powerCommand
+
+
+FRAME_SIZE = 5
+
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered)-1, int(fraction*len(ordered)))]
+    return {'count': len(ordered),
+            'mean': sum(ordered)/len(ordered),
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'max': ordered[-1]}
+
+
+class VirtualBaseStation(object):
+
+    def __init__(self, latency=0.0, baudrate=None, stallProbability=0.0, stallTime=0.0, seed=0):
+        self.latency = latency  # seconds the station needs for every frame
+        self.baudrate = baudrate
+        self.stallProbability = stallProbability  # chance of a stall after every frame
+        self.stallTime = stallTime
+        self.random = random.Random(seed)
+        self.masterFd, slaveFd = os.openpty()
+        self.port = os.ttyname(slaveFd)
+        # the slave side stays open so writes back up instead of failing while the station stalls
+        self.slaveFd = slaveFd
+        self.lock = threading.Lock()
+        self.frames = []  # (arrival time, left power, right power)
+        self.sentAt = {}  # command -> time it was last sent (see expect)
+        self.latencies = []
+        self.framingErrors = 0
+        self.stalls = 0
+        self.stalledUntil = 0
+        self.connected = True
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='VirtualBaseStation %s' % self.port)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def frameDelay(self):
+        delay = self.latency
+        if self.baudrate:
+            delay += FRAME_SIZE*10.0/self.baudrate  # 8N1: 10 bits per byte
+        return delay
+
+    def run(self):
+        buffer = b''
+        while self.running:
+            wait = self.stalledUntil-time.perf_counter()
+            if wait > 0:
+                time.sleep(min(wait, 0.05))
+                continue
+            readable = select.select([self.masterFd], [], [], 0.05)[0]
+            if not readable:
+                continue
+            try:
+                # one frame at a time when the station is slow, so the writes back up in the pty
+                data = os.read(self.masterFd, FRAME_SIZE if self.frameDelay() else 4096)
+            except OSError:
+                break
+            if not data:
+                break
+            buffer += data
+            buffer = self.decode(buffer)
+
+    def decode(self, buffer):
+        # the power bytes can be 10 as well, so frames are found by length and checked by their last byte
+        while len(buffer) >= FRAME_SIZE:
+            if buffer[FRAME_SIZE-1] != 10:
+                self.framingErrors += 1
+                buffer = buffer[1:]
+                continue
+            frame = bytes(buffer[:FRAME_SIZE])
+            buffer = buffer[FRAME_SIZE:]
+            delay = self.frameDelay()
+            if delay:
+                time.sleep(delay)
+            now = time.perf_counter()
+            with self.lock:
+                self.frames.append((now, frame[2], frame[3]))
+                # every command is written more than once; the first copy counts
+                sentAt = self.sentAt.pop(frame, None)
+                if sentAt is not None:
+                    self.latencies.append(now-sentAt)
+            if self.stallProbability and self.random.random() < self.stallProbability:
+                self.stall(self.stallTime)
+        return buffer
+
+    def expect(self, command):
+        # called right before command is sent, to measure when it arrives
+        with self.lock:
+            self.sentAt[command] = time.perf_counter()
+
+    def stall(self, seconds):
+        self.stalls += 1
+        self.stalledUntil = time.perf_counter()+seconds
+
+    def lastPower(self):
+        with self.lock:
+            return self.frames[-1][1:] if self.frames else None
+
+    def disconnect(self):
+        # like pulling the usb cable: the port disappears and writes to it fail
+        if not self.connected:
+            return
+        self.connected = False
+        self.running = False
+        self.thread.join(1)
+        os.close(self.masterFd)
+        os.close(self.slaveFd)
+
+    def stats(self):
+        with self.lock:
+            frames = len(self.frames)
+            duration = self.frames[-1][0]-self.frames[0][0] if frames > 1 else 0
+            return {'port': self.port,
+                    'connected': self.connected,
+                    'frames': frames,
+                    'framesPerSecond': (frames-1)/duration if duration else 0,
+                    'framingErrors': self.framingErrors,
+                    'stalls': self.stalls,
+                    'notReceived': len(self.sentAt),  # coalesced, or lost when the station stalled or was unplugged
+                    'latency': summarize(self.latencies)}
+
+
+class BaseStationSimulator(object):
+
+    def __init__(self):
+        self.stations = []
+
+    def addStation(self, **options):
+        station = VirtualBaseStation(seed=len(self.stations), **options)
+        self.stations.append(station)
+        return station
+
+    def findPorts(self):
+        # stands in for findBaseStationPorts
+        return [station.port for station in self.stations if station.connected]
+
+    def station(self, port):
+        for station in self.stations:
+            if station.port == port:
+                return station
+        return None
+
+    def close(self):
+        for station in self.stations:
+            station.disconnect()
+
+    def stats(self):
+        return [station.stats() for station in self.stations]
+
+
+def runSimulation(args):
+    simulator = BaseStationSimulator()
+    for _ in range(args.stations):
+        simulator.addStation(latency=args.latency, baudrate=args.baudrate,
+                             stallProbability=args.stall_probability, stallTime=args.stall_time)
+    writers = [BaseStationWriter(openBaseStation(port)) for port in simulator.findPorts()]
+    stations = [simulator.station(writer.baseStation.port) for writer in writers]
+    try:
+        start = time.perf_counter()
+        sendTimes = []
+        for update in range(args.updates):
+            # every update is a different command, so its frames can be told apart
+            command = powerCommand(update % 256, (update//256) % 256)
+            if update == args.updates//2:
+                for station in stations[:args.disconnects]:
+                    station.disconnect()
+            sendStart = time.perf_counter()
+            for station, writer in zip(stations, writers):
+                # in the game the port monitor detaches an unplugged station
+                if station.connected:
+                    station.expect(command)
+                    writer.send(command)
+            sendTimes.append(time.perf_counter()-sendStart)
+            nextUpdate = start+(update+1)/args.rate
+            time.sleep(max(0, nextUpdate-time.perf_counter()))
+        sendDuration = time.perf_counter()-start
+        # give the writers and stations time to catch up
+        deadline = time.perf_counter()+max(2, args.stall_time*2)
+        while time.perf_counter() < deadline and any(writer.queueDepth() for writer in writers):
+            time.sleep(0.01)
+        time.sleep(0.1)
+        duration = time.perf_counter()-start
+    finally:
+        for writer in writers:
+            writer.stop()
+            try:
+                writer.baseStation.close()
+            except OSError:
+                pass
+    stationStats = simulator.stats()
+    simulator.close()
+    writerStats = [writer.stats() for writer in writers]
+    allLatencies = [latency for station in stations for latency in station.latencies]
+    frames = sum(stats['frames'] for stats in stationStats)
+    return {'stations': args.stations,
+            'updates': args.updates,
+            'rate': args.rate,
+            'latency': args.latency,
+            'baudrate': args.baudrate,
+            'stallProbability': args.stall_probability,
+            'stallTime': args.stall_time,
+            'disconnects': args.disconnects,
+            'duration': duration,
+            'sendDuration': sendDuration,
+            'sendCall': summarize(sendTimes),
+            'commandsWritten': sum(stats['sent'] for stats in writerStats),
+            'commandsCoalesced': sum(stats['coalesced'] for stats in writerStats),
+            'writeErrors': sum(stats['errors'] for stats in writerStats),
+            'framesReceived': frames,
+            'framesPerSecond': frames/duration if duration else 0,
+            'endToEndLatency': summarize(allLatencies),
+            'writeLatency': summarize([stats['meanLatency'] for stats in writerStats if stats['sent']]),
+            'perStation': stationStats}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Drive virtual MSMD base stations and measure the serial throughput')
+    parser.add_argument('--stations', type=int, default=8, help='number of virtual base stations')
+    parser.add_argument('--updates', type=int, default=1000, help='number of power updates sent to every station')
+    parser.add_argument('--rate', type=float, default=200, help='power updates per second')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds a station needs for every frame')
+    parser.add_argument('--baudrate', type=int, help='simulated baud rate of the stations (default: unlimited)')
+    parser.add_argument('--stall-probability', type=float, default=0.0, help='chance of a stall after every frame')
+    parser.add_argument('--stall-time', type=float, default=0.5, help='seconds a stall lasts')
+    parser.add_argument('--disconnects', type=int, default=0, help='number of stations unplugged halfway through')
+    parser.add_argument('--output', help='json file to write the results to (default: stdout)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+    if not hasattr(os, 'openpty'):
+        parser.error('pseudo terminals are not available on this platform')
+
+    results = runSimulation(args)
+    if args.output:
+        with open(args.output, 'w') as outputFile:
+            json.dump(results, outputFile, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Headless benchmark of the game over synthetic (or given) content.
+
+usage: python Benchmark.py [--levels N] [--images N] [--width W] [--height H]
+                           [--sounds] [--content FOLDER] [--stations N]
+                           [--label NAME] [--output FILE]
+
+App is run under Qt's offscreen platform with a fake serial backend (one
+base station that accepts every write) and an audio engine without an
+output. The benchmark measures folder selection and validation, the latency
+of every step (from the simulated itemClickedEvent/keyPressed signal until
+the view has repainted), level transitions and peak RSS, and prints the
+results as json so runs of different releases can be compared. With
+--stations the game drives that many virtual base stations (see
+BaseStationSimulator.py) through the real serial code instead of the fake
+one, and the frames they received are reported as well.
+"""
+
+import os
+import sys
+import json
+import wave
+import time
+import random
+import shutil
+import argparse
+import platform
+import configparser
+import tempfile
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import Qt, QEventLoop, QTimer
+from PyQt5.QtGui import QImage, QPainter, QColor, QFont
+from PyQt5.QtWidgets import QApplication, QMessageBox
+from AudioEngine import AudioEngine
+from BaseStationSimulator import BaseStationSimulator, summarize
+from HotSpotTable import STEP_MOUSE
+from MSMD_multiLevel import App
+
+
+RESOURCE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'resources', 'base')
+
+
+class FakeSerial(object):
+    # stands in for serial.Serial; every write succeeds immediately
+
+    def __init__(self, port):
+        self.port = port
+        self.bytesWritten = 0
+
+    def write(self, data):
+        self.bytesWritten += len(data)
+        return len(data)
+
+    def close(self):
+        pass
+
+
+def writeSound(fileName, durationSeconds=0.05, rate=44100):
+    with wave.open(fileName, 'wb') as soundFile:
+        soundFile.setnchannels(1)
+        soundFile.setsampwidth(2)
+        soundFile.setframerate(rate)
+        soundFile.writeframes(bytes(int(rate*durationSeconds)*2))
+
+
+def makeSyntheticContent(folder, numLevels, numImages, width, height, withSounds=False, seed=0):
+    # every level gets numImages steps (numImages+1 images, the last one being the level end screen)
+    randomGenerator = random.Random(seed)
+    font = QFont('Sans', 48)
+    for level in range(numLevels):
+        levelFolder = os.path.join(folder, 'level%02d' % (level+1))
+        os.makedirs(levelFolder)
+        hotSpots = {}
+        for step in range(numImages+1):
+            image = QImage(width, height, QImage.Format_RGB32)
+            image.fill(QColor(randomGenerator.randrange(256), randomGenerator.randrange(256), randomGenerator.randrange(256)))
+            painter = QPainter(image)
+            painter.setFont(font)
+            painter.drawText(image.rect(), Qt.AlignCenter, 'level %s step %s' % (level+1, step))
+            painter.end()
+            image.save(os.path.join(levelFolder, '%06d.png' % step), 'PNG')
+            if step == numImages:
+                break
+            if step % 5 == 4:
+                hotSpots[str(step).zfill(6)] = {'type': 'key', 'name': 'a', 'scancode': 30, 'modifiers': []}
+            else:
+                hotSpots[str(step).zfill(6)] = {'type': 'mouse', 'button': 'left', 'modifiers': [],
+                                                'position': [randomGenerator.randrange(50, 1870), randomGenerator.randrange(50, 970)]}
+            if withSounds:
+                writeSound(os.path.join(levelFolder, 'sound%s.wav' % step))
+        with open(os.path.join(levelFolder, 'hotspots.json'), 'w') as hotSpotFile:
+            json.dump(hotSpots, hotSpotFile)
+
+
+def useWorkFolder(config, folder):
+    # logs, manifests, profiles and sessions go to the work folder, which is removed afterwards,
+    # and the content is not watched, since it is generated or copied there and never edited
+    config['app']['log_folder'] = os.path.join(folder, 'logs')
+    config['app']['manifest_folder'] = os.path.join(folder, 'manifests')
+    config['app']['profile_folder'] = os.path.join(folder, 'profiles')
+    config['app']['session_folder'] = os.path.join(folder, 'sessions')
+    config['app']['watch_content'] = '0'
+
+
+def writeBenchmarkConfig(folder, numLevels):
+    # every level is unlocked and the time limit can not be missed, so no dialog interrupts the run
+    config = configparser.ConfigParser()
+    config.read(os.path.join(RESOURCE_FOLDER, 'config.ini'))
+    config['robot']['upgradeTrigger'] = 'hotspot'
+    config['app']['showReferenceCreator'] = '0'
+    config['app']['level_to_unlock'] = str(max(0, numLevels-1))
+    config['app']['time_limit_multiplier'] = '1000000'
+    useWorkFolder(config, folder)
+    configFileName = os.path.join(folder, 'config.ini')
+    with open(configFileName, 'w') as configFile:
+        config.write(configFile)
+    return configFileName
+
+
+def dismissDialogs():
+    # answers the message boxes (level won, game won) as soon as they are shown
+    dialog = QApplication.activeModalWidget()
+    if isinstance(dialog, QMessageBox):
+        for button in (QMessageBox.Yes, QMessageBox.Ok):
+            if dialog.button(button) is not None:
+                dialog.button(button).click()
+                return
+        dialog.reject()
+
+
+def waitFor(condition, timeout=600):
+    start = time.perf_counter()
+    while not condition():
+        QApplication.processEvents(QEventLoop.AllEvents, 10)
+        if time.perf_counter()-start > timeout:
+            raise RuntimeError('benchmark timed out')
+
+
+def peakRss():
+    # bytes, or None where it can not be measured
+    if resource is None:
+        return None
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRss if sys.platform == 'darwin' else maxRss*1024
+
+
+def playThrough(game):
+    # simulates the correct input of every step until the game returns to the home screen
+    stepTimes = []
+    transitionTimes = []
+    start = time.perf_counter()
+    game.startButtonClicked()
+    game.graphicsView.viewport().repaint()
+    startTime = time.perf_counter()-start
+    while game.stackedLayout.currentIndex() == 1:
+        table = game.hotSpotTable
+        step = game.currentImageNumber
+        level = game.currentLevel
+        start = time.perf_counter()
+        if table.types[step] == STEP_MOUSE:
+            game.graphicsView.itemClickedEvent.emit(game.scene.hotSpot, Qt.KeyboardModifiers(Qt.NoModifier), Qt.MouseButton(table.buttons[step]))
+        else:
+            game.graphicsView.keyPressed.emit(table.scancodes[step], '', Qt.KeyboardModifiers(Qt.NoModifier))
+        # level and game end dialogs do not block, they are answered by dismissDialogs
+        waitFor(lambda: game.seatDialog is None)
+        game.graphicsView.viewport().repaint()
+        elapsed = time.perf_counter()-start
+        if game.currentLevel != level:
+            transitionTimes.append(elapsed)
+        elif game.stackedLayout.currentIndex() == 1:
+            stepTimes.append(elapsed)
+    return startTime, stepTimes, transitionTimes
+
+
+def runBenchmark(args, workFolder):
+    content = args.content
+    if content is None:
+        content = os.path.join(workFolder, 'content')
+        start = time.perf_counter()
+        makeSyntheticContent(content, args.levels, args.images, args.width, args.height, args.sounds)
+        print('synthetic content created in %.1f s' % (time.perf_counter()-start), file=sys.stderr)
+    numLevels = len([name for name in os.listdir(content) if os.path.isdir(os.path.join(content, name))])
+
+    resources = {'fileConfig': writeBenchmarkConfig(workFolder, numLevels),
+                 'icoMSMD': os.path.join(RESOURCE_FOLDER, 'MSMD32.png'),
+                 'imgRefresh': os.path.join(RESOURCE_FOLDER, 'refresh.png'),
+                 'imgSettings': os.path.join(RESOURCE_FOLDER, 'settings.png')}
+    simulator = None
+    if args.stations:
+        simulator = BaseStationSimulator()
+        for _ in range(args.stations):
+            simulator.addStation()
+        game = App(resources, findPorts=simulator.findPorts, audioEngine=AudioEngine(openOutput=False))
+    else:
+        game = App(resources, findPorts=lambda: ['FAKE0'], openPort=FakeSerial, audioEngine=AudioEngine(openOutput=False))
+    dismisser = QTimer()
+    dismisser.timeout.connect(dismissDialogs)
+    dismisser.start(1)
+    try:
+        start = time.perf_counter()
+        game.selectContent(content)
+        waitFor(game.startButton.isEnabled)
+        validationTime = time.perf_counter()-start
+        if simulator is not None:
+            waitFor(lambda: len(game.robot) == args.stations)
+
+        passes = []
+        for _ in range(args.passes):
+            startTime, stepTimes, transitionTimes = playThrough(game)
+            passes.append({'start': startTime,
+                           'steps': summarize(stepTimes),
+                           'levelTransitions': summarize(transitionTimes)})
+        results = {'label': args.label,
+                   'appVersion': game.versionNumber,
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'screen': [game.screen.width(), game.screen.height()],
+                   'content': {'folder': content if args.content else None,
+                               'levels': game.numLevels,
+                               'images': game.numTotalImages,
+                               'width': args.width,
+                               'height': args.height,
+                               'sounds': args.sounds},
+                   'validation': validationTime,
+                   'passes': passes,
+                   'imageCache': game.imageCache.stats(),
+                   'peakRss': peakRss()}
+        if simulator is not None:
+            results['baseStations'] = {'writers': [writer.stats() for writer in game.robotWriters],
+                                       'stations': simulator.stats()}
+        return results
+    finally:
+        dismisser.stop()
+        game.close()
+        if simulator is not None:
+            simulator.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless MSMD benchmark')
+    parser.add_argument('--levels', type=int, default=3, help='number of synthetic levels')
+    parser.add_argument('--images', type=int, default=50, help='number of steps per synthetic level')
+    parser.add_argument('--width', type=int, default=1920, help='synthetic image width')
+    parser.add_argument('--height', type=int, default=1080, help='synthetic image height')
+    parser.add_argument('--sounds', action='store_true', help='give every synthetic step a sound')
+    parser.add_argument('--content', help='benchmark this content folder instead of synthetic content')
+    parser.add_argument('--passes', type=int, default=2, help='number of times the game is played through')
+    parser.add_argument('--stations', type=int, default=0, help='number of virtual base stations to drive instead of the fake one')
+    parser.add_argument('--label', default='', help='name of the build being measured')
+    parser.add_argument('--output', help='json file to write the results to (default: stdout)')
+    args = parser.parse_args(argv)
+
+    application = QApplication(sys.argv[:1])
+    workFolder = tempfile.mkdtemp(prefix='msmd-benchmark-')
+    try:
+        results = runBenchmark(args, workFolder)
+    finally:
+        shutil.rmtree(workFolder, ignore_errors=True)
+    application.processEvents()
+    if args.output:
+        with open(args.output, 'w') as outputFile:
+            json.dump(results, outputFile, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Manifest of a content folder, so it is not validated again when it did not change.
+
+Validating a level reads its hotspots.json and the header of every png file.
+The manifest keeps the result of that (hotspot count, image files and image
+sizes) per level, together with the names, sizes and modification times of
+the level's files. When the content is selected again, a level whose files
+still have the same sizes and modification times is taken from the manifest,
+which only needs a stat of every file; only the other levels are validated.
+Manifests are json files in the user's cache folder, named after the path of
+the content folder, so read-only or shared content folders work as well.
+Content packs do not need one: their index already has all of this.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from ContentValidator import LevelInfo, SOUND_FILE_PATTERN
+
+
+log = logging.getLogger('msmd.manifest')
+
+MANIFEST_VERSION = 1
+
+
+def isLevelFile(fileName, hotSpotFilename='hotspots.json'):
+    return fileName == hotSpotFilename or fileName.endswith('.png') or SOUND_FILE_PATTERN.match(fileName) is not None
+
+
+def levelSignature(levelFolder, hotSpotFilename='hotspots.json'):
+    # {file name: (size, modification time)} of the files the game reads from the level
+    signature = {}
+    try:
+        for entry in os.scandir(levelFolder):
+            if entry.is_file() and isLevelFile(entry.name, hotSpotFilename):
+                fileStat = entry.stat()
+                signature[entry.name] = (fileStat.st_size, fileStat.st_mtime_ns)
+    except OSError:
+        return None
+    return signature
+
+
+def manifestFileName(folderName, manifestFolder):
+    folderKey = hashlib.sha1(os.path.abspath(folderName).encode('utf-8')).hexdigest()
+    return os.path.join(manifestFolder, folderKey+'.json')
+
+
+class ContentManifest(object):
+
+    def __init__(self, folderName, manifestFolder, hotSpotFilename='hotspots.json'):
+        self.folderName = folderName
+        self.fileName = manifestFileName(folderName, manifestFolder)
+        self.hotSpotFilename = hotSpotFilename
+        self.lock = threading.Lock()  # levels are looked up and added from the validation workers
+        self.levels = {}  # level folder -> manifest entry
+        self.signatures = {}  # level folder -> signature taken before it was validated
+        self.loaded = False
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.fileName, 'r') as manifestFile:
+                manifest = json.load(manifestFile)
+        except (IOError, ValueError):
+            return
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('hotSpotFilename') != self.hotSpotFilename:
+            return
+        self.levels = manifest.get('levels', {})
+
+    def levelInfo(self, levelFolder):
+        # the level's LevelInfo if its files did not change since it was added, else None
+        signature = levelSignature(levelFolder, self.hotSpotFilename)
+        with self.lock:
+            entry = self.levels.get(levelFolder)
+            if signature is not None and entry is not None and \
+                    {name: tuple(fileStat) for name, fileStat in entry['signature'].items()} == signature:
+                self.hits += 1
+                levelInfo = LevelInfo(levelFolder)
+                levelInfo.numHotSpotRecords = entry['numHotSpotRecords']
+                levelInfo.imageFiles = entry['imageFiles']
+                levelInfo.imageSizes = [tuple(imageSize) for imageSize in entry['imageSizes']]
+                levelInfo.numImages = entry['numImages']
+                levelInfo.error = entry['error']
+                return levelInfo
+            self.misses += 1
+            self.signatures[levelFolder] = signature
+        return None
+
+    def add(self, levelInfo):
+        # called with the result of validating a level that levelInfo() did not have
+        with self.lock:
+            signature = self.signatures.pop(levelInfo.folder, None)
+            if signature is None:
+                self.levels.pop(levelInfo.folder, None)
+                return
+            # the signature was taken before the files were read, so a file changed meanwhile is read again next time
+            self.levels[levelInfo.folder] = {'signature': signature,
+                                             'numHotSpotRecords': levelInfo.numHotSpotRecords,
+                                             'imageFiles': levelInfo.imageFiles,
+                                             'imageSizes': levelInfo.imageSizes,
+                                             'numImages': levelInfo.numImages,
+                                             'error': levelInfo.error}
+            self.changed = True
+
+    def retain(self, levelFolders):
+        # levels that are no longer part of the content are dropped
+        with self.lock:
+            for levelFolder in set(self.levels)-set(levelFolders):
+                del self.levels[levelFolder]
+                self.changed = True
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            manifest = {'version': MANIFEST_VERSION,
+                        'folder': os.path.abspath(self.folderName),
+                        'hotSpotFilename': self.hotSpotFilename,
+                        'levels': dict(self.levels)}
+            self.changed = False
+        # several seats can save the manifest of the same content at the same time
+        temporaryFileName = '%s.%s.%s.tmp' % (self.fileName, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.dirname(self.fileName), exist_ok=True)
+            with open(temporaryFileName, 'w') as manifestFile:
+                json.dump(manifest, manifestFile)
+            os.replace(temporaryFileName, self.fileName)
+        except (IOError, OSError, TypeError, ValueError) as error:
+            log.warning('could not save the content manifest %s: %s', self.fileName, error)
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'levels': len(self.levels)}
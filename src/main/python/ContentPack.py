@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Single file content pack (.msmdpack) holding every level of a content folder.
+
+Layout:
+    header      magic, format version and index length (see HEADER)
+    index       utf-8 json with, for every level, its name, hotspot table,
+                image blob table and sound blob table
+    blobs       the png and wav files, stored unchanged
+
+Blob offsets in the index are relative to the first byte after the index.
+The pack is opened with mmap and blobs are returned as memoryview slices of
+the mapping, so reading a blob does not copy it or open any other file.
+Packs are created from a content folder with PackContent.py.
+"""
+
+import os
+import json
+import mmap
+import struct
+
+
+PACK_EXTENSION = '.msmdpack'
+PACK_MAGIC = b'MSMDPACK'
+PACK_VERSION = 1
+HEADER = struct.Struct('<8sIQ')
+
+
+def isContentPack(fileName):
+    return fileName.lower().endswith(PACK_EXTENSION) and os.path.isfile(fileName)
+
+
+class ContentPack(object):
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.file = open(fileName, 'rb')
+        fileStat = os.fstat(self.file.fileno())
+        self.identity = '%s|%s|%s' % (os.path.abspath(fileName), fileStat.st_size, fileStat.st_mtime_ns)
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise IOError('%s is empty' % fileName)
+        try:
+            self.readIndex()
+        except (IOError, ValueError, KeyError, TypeError, struct.error) as error:
+            # a truncated or corrupt pack is reported like an unreadable one
+            self.close()
+            if isinstance(error, IOError):
+                raise
+            raise IOError('%s is not a valid content pack (%s)' % (fileName, error))
+        self.view = memoryview(self.map)
+
+    def readIndex(self):
+        if len(self.map) < HEADER.size:
+            raise IOError('%s is too short for a content pack' % self.fileName)
+        magic, version, indexLength = HEADER.unpack_from(self.map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise IOError('%s is not a version %s content pack' % (self.fileName, PACK_VERSION))
+        indexStart = HEADER.size
+        self.dataStart = indexStart+indexLength
+        if self.dataStart > len(self.map):
+            raise IOError('%s is truncated' % self.fileName)
+        self.index = json.loads(self.map[indexStart:self.dataStart].decode('utf-8'))
+        self.levels = {self.levelFolder(level['name']): level for level in self.index['levels']}
+
+    def levelFolder(self, levelName):
+        # a single level pack stores its only level with an empty name
+        if levelName:
+            return os.path.join(self.fileName, levelName)
+        return self.fileName
+
+    def levelFolders(self):
+        return [self.levelFolder(level['name']) for level in self.index['levels']]
+
+    def isSingleLevel(self):
+        return len(self.index['levels']) == 1 and self.index['levels'][0]['name'] == ''
+
+    def level(self, levelFolder):
+        return self.levels[levelFolder]
+
+    def hotSpots(self, levelFolder):
+        return self.levels[levelFolder]['hotspots']
+
+    def numImageBlobs(self, levelFolder):
+        return len(self.levels[levelFolder]['images'])
+
+    def blob(self, offset, length):
+        start = self.dataStart+offset
+        return self.view[start:start+length]
+
+    def imageData(self, levelFolder, imageIndex):
+        offset, length = self.levels[levelFolder]['images'][imageIndex][:2]
+        return self.blob(offset, length)
+
+    def soundData(self, levelFolder, soundNumber):
+        sound = self.levels[levelFolder]['sounds'].get(str(soundNumber))
+        if sound is None:
+            return None
+        return self.blob(*sound)
+
+    def close(self):
+        try:
+            if hasattr(self, 'view'):
+                self.view.release()
+            self.map.close()
+        except BufferError:
+            # blobs handed out are still in use; the mapping goes away with them
+            pass
+        self.file.close()
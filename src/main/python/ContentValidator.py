@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Validation of a selected content folder without decoding any image.
+
+Each level is checked by comparing the number of records in its hotspots.json
+with the number of png files in the level folder. Only the png headers are
+read (to make sure the files are png images and to get their size); the
+images themselves are decoded when the level is actually played. Levels are
+validated in parallel on a pool of worker threads. Content packs carry their
+image sizes and hotspot tables in their index, so no file is read for them.
+With a ContentManifest, levels whose files did not change since they were
+last validated are not read either.
+"""
+
+import os
+import re
+import json
+import struct
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+log = logging.getLogger('msmd.validator')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+SOUND_FILE_PATTERN = re.compile(r'^sound(\d+)\.wav$')
+
+# LevelInfo.error values
+ERROR_NONE = ''
+ERROR_HOTSPOTS = 'hotspots'
+ERROR_IMAGES = 'images'
+ERROR_MISMATCH = 'mismatch'
+
+
+def readPngSize(fileName):
+    # the IHDR chunk always comes first, right after the 8 byte signature
+    with open(fileName, 'rb') as pngFile:
+        header = pngFile.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        raise IOError('%s is not a valid png file' % fileName)
+    return struct.unpack('>II', header[16:24])
+
+
+class LevelInfo(object):
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.name = os.path.basename(folder)
+        self.imageFiles = []
+        self.imageSizes = []
+        self.numHotSpotRecords = 0
+        self.numImages = 0
+        self.error = ERROR_NONE
+
+
+def validateLevel(levelFolder, hotSpotFilename='hotspots.json', manifest=None):
+    # levels whose files did not change since the last time are taken from the manifest (see ContentManifest.py)
+    if manifest is None:
+        return checkedReadLevel(levelFolder, hotSpotFilename)
+    levelInfo = manifest.levelInfo(levelFolder)
+    if levelInfo is None:
+        levelInfo = checkedReadLevel(levelFolder, hotSpotFilename)
+        manifest.add(levelInfo)
+    return levelInfo
+
+
+def checkedReadLevel(levelFolder, hotSpotFilename='hotspots.json'):
+    # whatever is wrong with a level's files, it is reported as an invalid level
+    try:
+        return readLevel(levelFolder, hotSpotFilename)
+    except Exception:
+        log.exception('could not validate level %s', levelFolder)
+        levelInfo = LevelInfo(levelFolder)
+        levelInfo.error = ERROR_HOTSPOTS
+        return levelInfo
+
+
+def readLevel(levelFolder, hotSpotFilename='hotspots.json'):
+    levelInfo = LevelInfo(levelFolder)
+    try:
+        with open(os.path.join(levelFolder, hotSpotFilename), 'r') as hotSpotFile:
+            hotSpots = json.load(hotSpotFile)
+        # one record per step, keyed by the zero padded step number
+        if not isinstance(hotSpots, dict):
+            raise ValueError('%s is not a hotspot table' % hotSpotFilename)
+        levelInfo.numHotSpotRecords = len(hotSpots)
+    except (IOError, ValueError):
+        levelInfo.error = ERROR_HOTSPOTS
+        return levelInfo
+    try:
+        levelInfo.imageFiles = sorted(imfile for imfile in os.listdir(levelFolder) if imfile.endswith('.png'))
+        levelInfo.imageSizes = [readPngSize(os.path.join(levelFolder, imageFile)) for imageFile in levelInfo.imageFiles]
+    except IOError:
+        levelInfo.error = ERROR_IMAGES
+        return levelInfo
+    # the last image is the "level completed" screen and has no hotspot
+    levelInfo.numImages = len(levelInfo.imageFiles)-1
+    if(levelInfo.numImages != levelInfo.numHotSpotRecords):
+        levelInfo.error = ERROR_MISMATCH
+    return levelInfo
+
+
+def validatePackLevel(contentPack, levelFolder):
+    levelInfo = LevelInfo(levelFolder)
+    level = contentPack.level(levelFolder)
+    levelInfo.numHotSpotRecords = len(level['hotspots'])
+    levelInfo.imageFiles = [str(imageIndex) for imageIndex in range(len(level['images']))]
+    levelInfo.imageSizes = [tuple(image[2:4]) for image in level['images']]
+    levelInfo.numImages = len(levelInfo.imageFiles)-1
+    if(levelInfo.numImages != levelInfo.numHotSpotRecords):
+        levelInfo.error = ERROR_MISMATCH
+    return levelInfo
+
+
+def findLevelFolders(folderName):
+    # level folders are played in the order of their names
+    return [os.path.join(folderName, name) for name in sorted(os.listdir(folderName))
+            if os.path.isdir(os.path.join(folderName, name))]
+
+
+def validateContent(folderName, hotSpotFilename='hotspots.json', progressCallback=None, maxWorkers=None, contentPack=None, manifest=None):
+    # returns a LevelInfo per level folder, or a single LevelInfo for the
+    # selected folder itself if it has no level folders (single level game)
+    if contentPack is not None:
+        levelInfoList = [validatePackLevel(contentPack, levelFolder) for levelFolder in contentPack.levelFolders()]
+        if progressCallback:
+            progressCallback(len(levelInfoList), len(levelInfoList))
+        return levelInfoList
+    levelFolders = findLevelFolders(folderName)
+    if manifest is not None:
+        manifest.load()
+        manifest.retain(levelFolders or [folderName])
+    if not levelFolders:
+        levelInfo = validateLevel(folderName, hotSpotFilename, manifest)
+        if manifest is not None:
+            manifest.save()
+        if progressCallback:
+            progressCallback(1, 1)
+        return [levelInfo]
+    return validateLevels(levelFolders, hotSpotFilename, progressCallback, maxWorkers, manifest)
+
+
+def validateLevels(levelFolders, hotSpotFilename='hotspots.json', progressCallback=None, maxWorkers=None, manifest=None):
+    # validates the given level folders only, e.g. the ones that changed since the content was selected
+    if manifest is not None:
+        manifest.load()
+    if maxWorkers is None:
+        maxWorkers = min(8, (os.cpu_count() or 1)*2)
+    results = {}
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = {executor.submit(validateLevel, levelFolder, hotSpotFilename, manifest): levelFolder for levelFolder in levelFolders}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progressCallback:
+                progressCallback(len(results), len(levelFolders))
+    if manifest is not None:
+        manifest.save()
+    return [results[levelFolder] for levelFolder in levelFolders]
+
+
+class ValidationThread(QThread):
+    progress = pyqtSignal(int, int)
+    validated = pyqtSignal('PyQt_PyObject')
+
+    def __init__(self, folderName, hotSpotFilename, contentPack=None, levelFolders=None, manifest=None):
+        super().__init__()
+        self.folderName = folderName
+        self.hotSpotFilename = hotSpotFilename
+        self.contentPack = contentPack
+        self.levelFolders = levelFolders
+        self.manifest = manifest
+
+    def run(self):
+        # validated is always emitted, the game waits for it before it enables its buttons again
+        try:
+            if self.levelFolders is not None:
+                levelInfoList = validateLevels(self.levelFolders, self.hotSpotFilename, self.progress.emit, manifest=self.manifest)
+            else:
+                levelInfoList = validateContent(self.folderName, self.hotSpotFilename, self.progress.emit, contentPack=self.contentPack, manifest=self.manifest)
+        except Exception:
+            log.exception('could not validate %s', self.folderName)
+            levelInfoList = [LevelInfo(levelFolder) for levelFolder in (self.levelFolders or [self.folderName])]
+            for levelInfo in levelInfoList:
+                levelInfo.error = ERROR_HOTSPOTS
+        self.validated.emit(levelInfoList)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Watches the selected content folder for changes made while it is selected.
+
+The content folder and its level folders are watched with a
+QFileSystemWatcher; the files in them are not, since every watched path
+takes a file descriptor on some platforms (kqueue on macOS) and a level can
+have hundreds of images. Events are collected for a short while, since
+saving one file usually produces several of them, and then only the levels
+they point to are checked: a level counts as changed when the names, sizes
+or modification times of the files the game reads from it (hotspots.json,
+the png images and the sound wav files) differ from the last check, which
+only needs a stat of every file. A file overwritten in place does not
+change its folder, so every level is also checked every few seconds while
+polling is on; the game turns it off while a level is played.
+levelsChanged reports the level folders of the content together with the
+ones that changed (or are new), so only those have to be validated and
+loaded again.
+"""
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+from ContentValidator import findLevelFolders
+from ContentManifest import levelSignature
+
+
+DEBOUNCE_INTERVAL = 300  # ms
+POLL_INTERVAL = 5000  # ms
+
+
+class ContentWatcher(QObject):
+    levelsChanged = pyqtSignal('PyQt_PyObject', 'PyQt_PyObject')
+
+    def __init__(self, hotSpotFilename='hotspots.json', debounceInterval=DEBOUNCE_INTERVAL, pollInterval=POLL_INTERVAL, parent=None):
+        super().__init__(parent)
+        self.hotSpotFilename = hotSpotFilename
+        self.folderName = None
+        self.levelFolders = []
+        self.signatures = {}  # level folder -> levelSignature at the last check
+        self.dirtyLevels = set()
+        self.polling = True
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.directoryChangedHandler)
+        self.debounceTimer = QTimer(self)
+        self.debounceTimer.setSingleShot(True)
+        self.debounceTimer.setInterval(debounceInterval)
+        self.debounceTimer.timeout.connect(self.checkChanges)
+        self.pollTimer = QTimer(self)
+        self.pollTimer.setInterval(pollInterval)
+        self.pollTimer.timeout.connect(self.pollLevels)
+
+    def watch(self, folderName):
+        self.stop()
+        self.folderName = folderName
+        self.levelFolders = self.findLevels()
+        for levelFolder in self.levelFolders:
+            self.signatures[levelFolder] = levelSignature(levelFolder, self.hotSpotFilename)
+        self.updateWatchedPaths()
+        if self.polling:
+            self.pollTimer.start()
+
+    def stop(self):
+        self.debounceTimer.stop()
+        self.pollTimer.stop()
+        paths = self.watcher.directories()
+        if paths:
+            self.watcher.removePaths(paths)
+        self.folderName = None
+        self.levelFolders = []
+        self.signatures = {}
+        self.dirtyLevels = set()
+
+    def setPolling(self, polling):
+        # the folder events are still handled while polling is off
+        self.polling = polling
+        if polling and self.folderName is not None:
+            self.pollTimer.start()
+        else:
+            self.pollTimer.stop()
+
+    def findLevels(self):
+        # a folder without level folders is a single level game
+        try:
+            return findLevelFolders(self.folderName) or [self.folderName]
+        except OSError:
+            return []
+
+    def updateWatchedPaths(self):
+        # level folders that were renamed away drop out of the watcher, new ones are added
+        wanted = set([self.folderName]) | set(self.levelFolders)
+        watched = set(self.watcher.directories())
+        if watched-wanted:
+            self.watcher.removePaths(list(watched-wanted))
+        if wanted-watched:
+            self.watcher.addPaths(sorted(wanted-watched))
+
+    def directoryChangedHandler(self, path):
+        self.dirtyLevels.add(path)
+        self.debounceTimer.start()
+
+    def pollLevels(self):
+        # catches files overwritten in place, which the folder events do not report
+        if self.folderName is None:
+            return
+        self.dirtyLevels.update(self.levelFolders)
+        self.dirtyLevels.add(self.folderName)
+        self.checkChanges()
+
+    def checkChanges(self):
+        if self.folderName is None:
+            return
+        dirtyLevels = self.dirtyLevels
+        self.dirtyLevels = set()
+        changed = []
+        levelFolders = self.levelFolders
+        if self.folderName in dirtyLevels:
+            # level folders may have been added, removed or renamed
+            levelFolders = self.findLevels()
+            for levelFolder in set(self.levelFolders)-set(levelFolders):
+                del self.signatures[levelFolder]
+        for levelFolder in levelFolders:
+            if levelFolder in self.signatures and levelFolder not in dirtyLevels:
+                continue
+            signature = levelSignature(levelFolder, self.hotSpotFilename)
+            if levelFolder not in self.signatures or signature != self.signatures[levelFolder]:
+                changed.append(levelFolder)
+            self.signatures[levelFolder] = signature
+        structureChanged = levelFolders != self.levelFolders
+        self.levelFolders = levelFolders
+        self.updateWatchedPaths()
+        if changed or structureChanged:
+            self.levelsChanged.emit(list(self.levelFolders), changed)
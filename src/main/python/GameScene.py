@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Retained-mode scene shown during the game.
+
+The scene holds one background item and one hotspot item for its whole
+life. Showing a step only updates their contents and geometry, and clicks
+are hit tested directly against the current hotspot circle instead of going
+through the scene's item index.
+
+The scene uses the coordinates of the recorded screenshots (SOURCE_RECT),
+so images and hotspot positions are used as they were recorded and the view
+scales the whole scene to its window. Hotspots are drawn and hit tested
+HOTSPOT_Y_OFFSET screen pixels below their recorded position, like the game
+always did; whoever scales the scene tells it the scale (setViewScale), so
+the offset stays the same number of pixels on every screen size.
+"""
+
+from PyQt5.QtCore import Qt, QRect, QRectF
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QColor, QBrush, QPen
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsPixmapItem, QGraphicsEllipseItem
+from ImagePrefetcher import SOURCE_RECT
+from HotSpotTable import HOTSPOT_Y_OFFSET
+
+
+# height of the instruction line above the scene in rendered reference frames
+CAPTION_HEIGHT = 30
+
+
+class GameScene(QGraphicsScene):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # fixed, so the parts of the images outside of the recorded area are never shown
+        self.setSceneRect(QRectF(SOURCE_RECT))
+        # the items never move between lookups, so the index would only be overhead
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
+
+        self.pens = {'right': QPen(QColor(0, 0, 255, 128)),
+                     'left': QPen(QColor(255, 0, 0, 128)),
+                     'middle': QPen(QColor(0, 255, 0, 128))}
+        self.defaultPen = QPen(QColor(0, 0, 0, 128))
+
+        self.background = QGraphicsPixmapItem()
+        self.addItem(self.background)
+
+        self.hotSpotX = 0
+        self.hotSpotY = 0
+        self.hotSpotYOffset = HOTSPOT_Y_OFFSET  # in scene coordinates, see setViewScale
+        self.hotSpotPosition = None  # recorded position and size of the hotspot being shown
+        self.hotSpot = QGraphicsEllipseItem()
+        self.hotSpot.setBrush(QBrush(QColor(180, 180, 180, 100)))
+        self.hotSpot.setZValue(1)
+        self.addItem(self.hotSpot)
+        self.hideHotSpot()
+
+    def setBackground(self, pixmap):
+        self.background.setPixmap(pixmap)
+
+    def setViewScale(self, yScale):
+        # yScale: screen pixels per scene unit in the vertical direction
+        self.hotSpotYOffset = HOTSPOT_Y_OFFSET/yScale
+        if self.hotSpotPosition is not None:
+            self.placeHotSpot(*self.hotSpotPosition)
+
+    def showHotSpot(self, xPosition, yPosition, size, mouseButton):
+        self.hotSpotPosition = (xPosition, yPosition, size)
+        self.placeHotSpot(xPosition, yPosition, size)
+        self.hotSpot.setPen(self.pens.get(mouseButton, self.defaultPen))
+        self.hotSpot.show()
+
+    def placeHotSpot(self, xPosition, yPosition, size):
+        self.hotSpotX = xPosition
+        self.hotSpotY = yPosition+self.hotSpotYOffset
+        self.hotSpotRadius = size/2
+        self.hotSpot.setRect(QRectF(self.hotSpotX-size/2, self.hotSpotY-size/2, size, size))
+
+    def hideHotSpot(self):
+        self.hotSpotRadius = -1
+        self.hotSpotPosition = None
+        self.hotSpot.hide()
+
+    def hotSpotAt(self, scenePosition):
+        # returns the hotspot item if the position is inside the hotspot circle
+        if self.hotSpotRadius < 0:
+            return None
+        dx = scenePosition.x()-self.hotSpotX
+        dy = scenePosition.y()-self.hotSpotY
+        if dx*dx+dy*dy <= self.hotSpotRadius*self.hotSpotRadius:
+            return self.hotSpot
+        return None
+
+    def clearStep(self):
+        self.setBackground(QPixmap())
+        self.hideHotSpot()
+
+    def renderFrame(self, size, caption=''):
+        # draws the scene scaled to size (with the step's instructions above it) into a new image, no window needed
+        frame = QImage(size.width(), size.height()+CAPTION_HEIGHT, QImage.Format_RGB32)
+        frame.fill(Qt.white)
+        painter = QPainter(frame)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.drawText(QRect(8, 0, size.width()-16, CAPTION_HEIGHT), Qt.AlignLeft | Qt.AlignVCenter, caption)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        self.render(painter, QRectF(0, CAPTION_HEIGHT, size.width(), size.height()), self.sceneRect(), Qt.IgnoreAspectRatio)
+        painter.end()
+        return frame
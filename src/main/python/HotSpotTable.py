@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled, array-backed form of a level's hotspots.json.
+
+The hotspot records are compiled once per level into parallel arrays (step
+type, mouse button, scancode, position and modifier bitmask), so matching an
+input event against the current step is a couple of integer comparisons
+with no per-event allocation.
+"""
+
+from array import array
+from PyQt5.QtCore import Qt
+
+
+STEP_MOUSE = 0
+STEP_KEY = 1
+STEP_INVALID = 2
+
+# modifier bits used in the compiled table
+MOD_SHIFT = 1
+MOD_ALT = 2
+MOD_CTRL = 4
+MOD_WIN = 8
+MOD_CMD = 16
+MOD_UNKNOWN = 32  # a recorded modifier that can never be pressed
+
+MODIFIER_BITS = {'shift': MOD_SHIFT, 'left shift': MOD_SHIFT, 'right shift': MOD_SHIFT,
+                 'alt': MOD_ALT, 'left alt': MOD_ALT, 'right alt': MOD_ALT,
+                 'ctrl': MOD_CTRL, 'left ctrl': MOD_CTRL, 'right ctrl': MOD_CTRL,
+                 'win': MOD_WIN,
+                 'cmd': MOD_CMD}
+
+# names shown in the window title, in display order
+MODIFIER_NAMES = ((MOD_SHIFT, 'shift'), (MOD_ALT, 'alt'), (MOD_CTRL, 'ctrl'), (MOD_WIN, 'win'), (MOD_CMD, 'cmd'))
+
+# the game has always drawn and hit tested the hotspots 30 px below the recorded position
+# scaled to the screen; the offset is in screen (view) pixels, see GameScene.setViewScale
+HOTSPOT_Y_OFFSET = 30
+
+MOUSE_BUTTONS = {'left': int(Qt.LeftButton), 'right': int(Qt.RightButton), 'middle': int(Qt.MiddleButton)}
+MOUSE_BUTTON_TEXT = {'left': 'left mouse button',
+                     'right': 'right mouse button',
+                     'middle': 'scroll wheel (middle mouse button)'}
+
+# Qt's shift, control, alt and meta modifier flags are 4 consecutive bits
+QT_MODIFIER_SHIFT = 25
+
+
+def buildModifierLookup(platformName):
+    # maps the 4 Qt modifier bits to the table's modifier bits for this platform
+    lookup = []
+    for qtBits in range(16):
+        mask = 0
+        if qtBits & (int(Qt.ShiftModifier) >> QT_MODIFIER_SHIFT):
+            mask |= MOD_SHIFT
+        if qtBits & (int(Qt.AltModifier) >> QT_MODIFIER_SHIFT):
+            mask |= MOD_ALT
+        # handle key differences for mac
+        if platformName in ['Windows', 'Linux']:
+            if qtBits & (int(Qt.ControlModifier) >> QT_MODIFIER_SHIFT):
+                mask |= MOD_CTRL
+            if qtBits & (int(Qt.MetaModifier) >> QT_MODIFIER_SHIFT):
+                mask |= MOD_WIN
+        else:
+            if qtBits & (int(Qt.ControlModifier) >> QT_MODIFIER_SHIFT):
+                mask |= MOD_CMD  # on the mac this is the command key
+            if qtBits & (int(Qt.MetaModifier) >> QT_MODIFIER_SHIFT):
+                mask |= MOD_CTRL  # on the mac this is the control key
+        lookup.append(mask)
+    return tuple(lookup)
+
+
+def pressedModifierMask(modifierLookup, pressedModifiers):
+    return modifierLookup[(int(pressedModifiers) >> QT_MODIFIER_SHIFT) & 0xF]
+
+
+class HotSpotTable(object):
+
+    def __init__(self, hotSpotDict):
+        numSteps = len(hotSpotDict)
+        self.types = array('b', [STEP_INVALID])*numSteps
+        self.buttons = array('i', [0])*numSteps
+        self.scancodes = array('i', [-1])*numSteps
+        self.x = array('d', [0])*numSteps
+        self.y = array('d', [0])*numSteps
+        self.modifiers = array('i', [0])*numSteps
+        self.buttonNames = ['']*numSteps
+        self.typeNames = ['']*numSteps
+        self.commandStrings = ['']*numSteps
+        self.textToScanCode = {}  # key names of this level -> scancodes, used to translate key presses
+        for step in range(numSteps):
+            metadata = hotSpotDict.get(str(step).zfill(6), {})
+            self.compileStep(step, metadata)
+
+    def __len__(self):
+        return len(self.types)
+
+    def compileStep(self, step, metadata):
+        mask = 0
+        for name in metadata.get('modifiers', []):
+            mask |= MODIFIER_BITS.get(name, MOD_UNKNOWN)
+        self.modifiers[step] = mask
+        modifierText = ''.join(name+' + ' for bit, name in MODIFIER_NAMES if mask & bit)
+        hType = metadata.get('type', '')
+        self.typeNames[step] = hType
+        if hType == 'mouse':
+            self.types[step] = STEP_MOUSE
+            button = metadata.get('button', '')
+            self.buttonNames[step] = button
+            self.buttons[step] = MOUSE_BUTTONS.get(button, 0)
+            self.x[step], self.y[step] = metadata['position'][:2]
+            self.commandStrings[step] = ('Press ' if mask else '')+modifierText+'Click '+MOUSE_BUTTON_TEXT.get(button, '')
+        elif hType == 'key':
+            self.types[step] = STEP_KEY
+            self.scancodes[step] = metadata.get('scancode', 0)
+            name = metadata.get('name', '')
+            self.textToScanCode[name] = self.scancodes[step]
+            self.commandStrings[step] = 'Press '+modifierText+name
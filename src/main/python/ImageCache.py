@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the display-ready (decoded and cropped) step images.
+
+PreparedImageCache is a small in-memory cache keyed by (level folder, image
+index) that holds the images of the prefetch window: the step being shown,
+the prefetched ones and the level end screen. It is bounded by a number of
+images, so its size follows the window and not the length of the level;
+steps that were played before are prepared again from the encoded images
+kept by the level store (see ImageStore.py). The least recently used images
+are dropped first, and the memory cap is an upper bound on top of that.
+"""
+
+import os
+from collections import OrderedDict
+from PyQt5.QtCore import QStandardPaths
+
+
+class PreparedImageCache(object):
+
+    def __init__(self, maxBytes, maxEntries):
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def makeKey(levelFolder, imageIndex):
+        return (levelFolder, imageIndex)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        image = self.entries.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return image
+
+    def put(self, key, image):
+        imageBytes = image.byteCount()
+        if imageBytes > self.maxBytes:
+            return
+        if key in self.entries:
+            self.currentBytes -= self.entries.pop(key).byteCount()
+        self.entries[key] = image
+        self.currentBytes += imageBytes
+        while self.currentBytes > self.maxBytes or len(self.entries) > self.maxEntries:
+            _, evicted = self.entries.popitem(last=False)
+            self.currentBytes -= evicted.byteCount()
+            self.evictions += 1
+
+    def levelFolders(self):
+        return set(key[0] for key in self.entries)
+
+    def invalidateLevel(self, levelFolder):
+        for key in [key for key in self.entries if key[0] == levelFolder]:
+            self.currentBytes -= self.entries.pop(key).byteCount()
+
+    def clear(self):
+        self.entries.clear()
+        self.currentBytes = 0
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.currentBytes,
+                'maxBytes': self.maxBytes,
+                'maxEntries': self.maxEntries}
+
+
+def defaultCacheFolder():
+    location = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+    if not location:
+        location = os.path.join(os.path.expanduser('~'), '.msmd', 'cache')
+    return location
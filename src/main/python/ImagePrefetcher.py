@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Background preparation of the display-ready images for upcoming steps.
+
+Each step image is decoded and cropped to the recorded screen area on worker
+threads while the student is still working on the current step, so the
+hotspot handlers only have to swap in an image that is already prepared.
+Images are not resampled: the game view scales the scene to the window.
+Prepared images are kept in a PreparedImageCache, which holds about the
+prefetch window of every seat.
+"""
+
+from PyQt5.QtCore import QRect, QObject, QRunnable, QThread, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage
+
+
+# area of the recorded screenshots that is shown during the game (the scene's coordinate space)
+SOURCE_RECT = QRect(0, 0, 1920, 1020)
+
+
+def prepareImage(image):
+    # QImage (unlike QPixmap) can safely be used outside of the GUI thread
+    if image.width() == SOURCE_RECT.width() and image.height() == SOURCE_RECT.height():
+        return image
+    return image.copy(SOURCE_RECT)
+
+
+class _PrepareImageTask(QRunnable):
+
+    def __init__(self, prefetcher, generation, index, imageList):
+        super().__init__()
+        self.prefetcher = prefetcher
+        self.generation = generation
+        self.index = index
+        self.imageList = imageList
+
+    def run(self):
+        # the image list decodes the source image here, on the worker thread
+        prepared = prepareImage(self.imageList[self.index])
+        # emitted from the worker thread, delivered to the GUI thread (queued)
+        self.prefetcher.imagePrepared.emit(self.generation, self.index, prepared)
+
+
+class ImagePrefetcher(QObject):
+    imagePrepared = pyqtSignal(int, int, QImage)
+
+    def __init__(self, depth, cache, parent=None):
+        super().__init__(parent)
+        self.depth = max(0, depth)
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, min(self.depth, QThread.idealThreadCount()-1)))
+        self.levelFolder = None
+        self.imageList = []
+        self.generation = 0
+        self.ready = {}
+        self.pending = set()
+        self.imagePrepared.connect(self.imagePreparedHandler)
+
+    def setLevel(self, levelFolder, imageList):
+        # results of tasks still running for the previous level are ignored
+        self.generation += 1
+        self.levelFolder = levelFolder
+        self.imageList = imageList
+        self.ready = {}
+        self.pending = set()
+
+    def prefetch(self, firstIndex):
+        if self.depth == 0:
+            return
+        # forget images of steps that have already been played
+        for index in [i for i in self.ready if i < firstIndex]:
+            del self.ready[index]
+        lastIndex = min(firstIndex+self.depth, len(self.imageList))
+        for index in range(firstIndex, lastIndex):
+            if index in self.ready or index in self.pending:
+                continue
+            if self.cacheKey(index) in self.cache:
+                continue
+            self.pending.add(index)
+            self.pool.start(_PrepareImageTask(self, self.generation, index, self.imageList))
+
+    def cacheKey(self, index):
+        return self.cache.makeKey(self.levelFolder, index)
+
+    def take(self, index):
+        # returns the prepared image, or prepares it now if the workers are not done with it yet
+        image = self.ready.pop(index, None)
+        if image is not None:
+            return image
+        key = self.cacheKey(index)
+        image = self.cache.get(key)
+        if image is None:
+            image = prepareImage(self.imageList[index])
+            self.cache.put(key, image)
+        return image
+
+    def imagePreparedHandler(self, generation, index, image):
+        if generation != self.generation:
+            return
+        self.pending.discard(index)
+        self.ready[index] = image
+        self.cache.put(self.cacheKey(index), image)
+
+    def stop(self):
+        self.generation += 1
+        self.pool.clear()
+        self.pool.waitForDone()
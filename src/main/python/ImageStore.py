@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Step images of a level kept encoded, decoded only when they are needed.
+
+A decoded 1920x1080 step image takes about 8 MB while its png usually takes
+a few hundred KB, so a level holds only the png bytes of its images (read
+from the level folder, or memoryview slices of a mapped content pack, which
+cost no memory of their own). Indexing an EncodedImageList decodes the
+image; the last few decoded images are kept in a small working set, which
+covers the step being shown and the steps the prefetcher prepares ahead of
+it. Memory use therefore grows with the working set instead of the level
+length. Decoding is thread safe, so the prefetch workers decode off the GUI
+thread.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from PyQt5.QtGui import QImage
+
+
+log = logging.getLogger('msmd.images')
+
+
+class EncodedImageList(object):
+
+    def __init__(self, encodedImages, workingSetSize=4):
+        self.encodedImages = encodedImages  # png data (bytes or memoryview) per image
+        self.workingSetSize = max(1, workingSetSize)
+        # slices of a mapped pack are not counted, the pack file backs them
+        self.encodedBytes = sum(len(data) for data in encodedImages if isinstance(data, bytes))
+        self.decoded = OrderedDict()
+        self.lock = threading.Lock()
+        self.decodes = 0
+
+    @classmethod
+    def fromFiles(cls, fileNames, workingSetSize=4):
+        encodedImages = []
+        for fileName in fileNames:
+            with open(fileName, 'rb') as imageFile:
+                encodedImages.append(imageFile.read())
+        return cls(encodedImages, workingSetSize)
+
+    def __len__(self):
+        return len(self.encodedImages)
+
+    def __getitem__(self, index):
+        with self.lock:
+            image = self.decoded.get(index)
+            if image is not None:
+                self.decoded.move_to_end(index)
+                return image
+        data = self.encodedImages[index]
+        image = QImage.fromData(data if isinstance(data, bytes) else bytes(data), 'PNG')
+        if image.isNull():
+            log.error('image %s could not be decoded', index)
+        with self.lock:
+            self.decodes += 1
+            self.decoded[index] = image
+            while len(self.decoded) > self.workingSetSize:
+                self.decoded.popitem(last=False)
+        return image
+
+    def byteCount(self):
+        with self.lock:
+            return self.encodedBytes+sum(image.byteCount() for image in self.decoded.values())
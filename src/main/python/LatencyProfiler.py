@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Input-to-frame latency instrumentation of the game's hot path.
+
+A step starts when GraphicsView receives a mouse or key event and ends when
+the view has painted the next frame. In between, the time spent in each
+phase (matching the input, playSound, setPower, preparing the image and
+updating the scene) is measured on a monotonic clock. Finished steps go into
+a rolling in-memory buffer that is exported as csv and json per session.
+
+The profiler only exists when profiling is enabled in config.ini; the hot
+path checks for it with a single "is not None" test.
+"""
+
+import os
+import csv
+import json
+import time
+from collections import deque
+
+
+PHASES = ('match', 'playSound', 'setPower', 'image', 'paint', 'frame')
+COLUMNS = ('level', 'step', 'input', 'startTime') + PHASES + ('total',)
+
+
+class LatencyProfiler(object):
+
+    def __init__(self, capacity=10000):
+        self.records = deque(maxlen=capacity)
+        self.sessionStart = time.time()
+        self.clockStart = time.perf_counter()
+        self.stepStart = None
+        self.lastMark = 0
+        self.marks = {}
+        self.inputKind = ''
+        self.painted = None
+
+    def beginStep(self, inputKind):
+        # an input event was received (wrong inputs simply get replaced by the next one)
+        now = time.perf_counter()
+        self.stepStart = now
+        self.lastMark = now
+        self.marks = {}
+        self.inputKind = inputKind
+        self.painted = None
+
+    def mark(self, phase):
+        # the phase that just ended gets the time since the previous mark
+        if self.stepStart is None:
+            return
+        now = time.perf_counter()
+        self.marks[phase] = self.marks.get(phase, 0)+now-self.lastMark
+        self.lastMark = now
+
+    def stepPainted(self, level, step):
+        self.mark('paint')
+        self.painted = (level, step)
+
+    def frameShown(self):
+        # called after the view painted; ends the step if its scene update was painted
+        if self.stepStart is None or self.painted is None:
+            return
+        self.mark('frame')
+        record = {'level': self.painted[0],
+                  'step': self.painted[1],
+                  'input': self.inputKind,
+                  'startTime': self.stepStart-self.clockStart,
+                  'total': self.lastMark-self.stepStart}
+        for phase in PHASES:
+            record[phase] = self.marks.get(phase, 0)
+        self.records.append(record)
+        self.stepStart = None
+        self.painted = None
+
+    def export(self, folder):
+        # writes session-<start time>.csv and .json; returns the csv file name
+        if not self.records:
+            return None
+        os.makedirs(folder, exist_ok=True)
+        baseName = os.path.join(folder, 'session-'+time.strftime('%Y%m%d-%H%M%S', time.localtime(self.sessionStart)))
+        with open(baseName+'.csv', 'w', newline='') as csvFile:
+            writer = csv.DictWriter(csvFile, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.records)
+        with open(baseName+'.json', 'w') as jsonFile:
+            json.dump({'sessionStart': self.sessionStart,
+                       'units': 'seconds',
+                       'phases': PHASES,
+                       'steps': list(self.records)}, jsonFile, indent=1)
+        return baseName+'.csv'
+
+    def reset(self):
+        self.records.clear()
+        self.sessionStart = time.time()
+        self.stepStart = None
+        self.painted = None
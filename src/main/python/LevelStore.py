@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Levels kept in memory after they were played.
+
+With compounding levels every pass starts again at the first level, so each
+level is loaded many times in a session. The store keeps the compiled
+hotspot table and the image list (see ImageStore.py) of the levels already
+loaded, so loading them again reads neither hotspots.json nor any png file.
+Whole levels are dropped in least recently used order once their images go
+over the memory budget.
+"""
+
+from collections import OrderedDict
+
+
+class LoadedLevel(object):
+
+    def __init__(self, hotSpotTable, imageList):
+        self.hotSpotTable = hotSpotTable
+        self.imageList = imageList
+        self.byteCount = imageList.byteCount()
+
+
+class LevelStore(object):
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.levels = OrderedDict()  # level folder -> LoadedLevel
+
+    def get(self, levelFolder):
+        level = self.levels.get(levelFolder)
+        if level is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.levels.move_to_end(levelFolder)
+        return level
+
+    def put(self, levelFolder, level):
+        self.invalidateLevel(levelFolder)
+        self.levels[levelFolder] = level
+        self.currentBytes += level.byteCount
+        # the level being played is kept even if it alone goes over the budget
+        while self.currentBytes > self.maxBytes and len(self.levels) > 1:
+            self.currentBytes -= self.levels.popitem(last=False)[1].byteCount
+            self.evictions += 1
+
+    def invalidateLevel(self, levelFolder):
+        level = self.levels.pop(levelFolder, None)
+        if level is not None:
+            self.currentBytes -= level.byteCount
+
+    def clear(self):
+        self.levels.clear()
+        self.currentBytes = 0
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'levels': len(self.levels),
+                'bytes': self.currentBytes,
+                'maxBytes': self.maxBytes}
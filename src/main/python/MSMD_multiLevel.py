@@ -23,55 +23,81 @@ Version History:
 
 import sys
 import os
+import io
 import fbs_runtime.platform as platform
 import time
 from fbs_runtime.application_context.PyQt5 import ApplicationContext
-from PyQt5.QtWidgets import (QApplication, QWidget, QLineEdit, QFileDialog, QPushButton, QLabel, QHBoxLayout, QVBoxLayout, QMessageBox, QStackedLayout, QGraphicsScene, QGraphicsView, QDesktopWidget, QGraphicsEllipseItem, QGraphicsItem)
-from PyQt5.QtGui import QIcon, QImage, QPixmap, QColor, QBrush, QPen
-from PyQt5.QtCore import Qt, QRect, pyqtSignal, QThread
-# this is the pyserial package (can be installed using pip)
-import serial
-import serial.tools.list_ports
+from PyQt5.QtWidgets import (QWidget, QLineEdit, QFileDialog, QPushButton, QLabel, QHBoxLayout, QVBoxLayout, QMessageBox, QStackedLayout, QGraphicsView, QDesktopWidget, QGraphicsItem, QProgressBar, QFrame)
+from PyQt5.QtGui import QIcon, QPixmap, QPainter
+from PyQt5.QtCore import Qt, pyqtSignal
 import json
+import logging
 import configparser
 from Settings import Settings
-try:
-    import pyautogui
-except:
-    pass
-import pyaudio
-import wave
-
-
-textToScanCodeTable = {}  # ~~~ why is there a global variable. This should be in the app class
-
-
-def buildScanCodeTranslationTable(hotSpotDict):  # ~~~ why is this a global function. This should be in the app class
-    for _, metadata in hotSpotDict.items():
-        hType = metadata.get('type', '')
-        if hType == "key":
-            scancode = metadata.get("scancode", 0)
-            name = metadata.get("name", '')
-            textToScanCodeTable[name] = scancode
-            print('name: %s, scancode %s' % (name, scancode))
+from ImagePrefetcher import ImagePrefetcher, prepareImage
+from ImageCache import defaultCacheFolder
+from ContentValidator import ValidationThread, ERROR_HOTSPOTS, ERROR_IMAGES, SOUND_FILE_PATTERN
+from ContentWatcher import ContentWatcher
+from ContentManifest import ContentManifest
+from ContentPack import ContentPack, PACK_EXTENSION, isContentPack
+from GameScene import GameScene
+from ReferenceRenderer import ReferenceRenderer
+from LatencyProfiler import LatencyProfiler
+from SessionRecorder import SessionRecorder, INPUT_MOUSE, INPUT_KEY
+from LevelStore import LoadedLevel
+from Seats import SharedResources
+from RaceClient import RaceClient
+from ImageStore import EncodedImageList
+from HotSpotTable import HotSpotTable, STEP_MOUSE, STEP_KEY, buildModifierLookup, pressedModifierMask
+from BaseStation import BaseStationWriter, findBaseStationPorts, openBaseStation, powerCommand, motorPowers
+
+
+log = logging.getLogger('msmd.app')
 
 
 class GraphicsView(QGraphicsView):
     itemClickedEvent = pyqtSignal(QGraphicsItem, Qt.KeyboardModifiers, Qt.MouseButton)
     keyPressed = pyqtSignal(int, str, Qt.KeyboardModifiers)
 
-    def __inti__(self, parent=None):
-        super(GraphicsView, self).__init__(parent)
+    def __init__(self, scene, parent=None):
+        super(GraphicsView, self).__init__(scene, parent)
+        # the scene stays in the recorded screen coordinates, the view transform fits it to the window
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setFrameShape(QFrame.NoFrame)
+        self.setRenderHint(QPainter.SmoothPixmapTransform)
+        self.textToScanCode = {}  # set to the key names of the level being played
+        self.profiler = None
+        self.recorder = None
+
+    def resizeEvent(self, event):
+        super(GraphicsView, self).resizeEvent(event)
+        self.fitInView(self.sceneRect(), Qt.IgnoreAspectRatio)
+        self.scene().setViewScale(self.transform().m22())
+
+    def paintEvent(self, event):
+        super(GraphicsView, self).paintEvent(event)
+        if self.profiler is not None:
+            self.profiler.frameShown()
 
     def mousePressEvent(self, event):
-        scenePosition = self.mapToScene(event.pos()).toPoint()
+        if self.profiler is not None:
+            self.profiler.beginStep('mouse')
+        scenePosition = self.mapToScene(event.pos())
         #print ('moserPressEvent pos %s scenePosition %s' % (event.pos(), scenePosition))
-        itemClicked = self.itemAt(scenePosition)
+        # direct check against the current hotspot circle (no scene index lookup)
+        itemClicked = self.scene().hotSpotAt(scenePosition)
         keyModifiers = event.modifiers()
         mouseButton = event.button()
+        if self.recorder is not None:
+            self.recorder.inputReceived(INPUT_MOUSE, itemClicked is not None, int(mouseButton), 0, int(keyModifiers))
         self.itemClickedEvent.emit(itemClicked, keyModifiers, mouseButton)
+        if self.recorder is not None:
+            self.recorder.inputHandled()
 
     def keyPressEvent(self, event):
+        if self.profiler is not None:
+            self.profiler.beginStep('key')
         super(GraphicsView, self).keyPressEvent(event)
         text = event.text()
         code = event.key()
@@ -88,15 +114,20 @@ class GraphicsView(QGraphicsView):
         except:
             textFromCode = text
 
-        translatedScanCode = textToScanCodeTable.get(text.lower(),textToScanCodeTable.get(textFromCode,0))
-        print('keyPressEvent text "%s" textFromCode %s scanCode %s key %s modifiers %s' % (
-            text,
-            textFromCode,
-            translatedScanCode,
-            code,
-            self.convertModifier(modifiers)))
-
+        translatedScanCode = self.textToScanCode.get(text.lower(),self.textToScanCode.get(textFromCode,0))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('keyPressEvent text "%s" textFromCode %s scanCode %s key %s modifiers %s',
+                      text,
+                      textFromCode,
+                      translatedScanCode,
+                      code,
+                      self.convertModifier(modifiers))
+
+        if self.recorder is not None:
+            self.recorder.inputReceived(INPUT_KEY, False, 0, translatedScanCode, int(modifiers))
         self.keyPressed.emit(translatedScanCode, textFromCode, modifiers)
+        if self.recorder is not None:
+            self.recorder.inputHandled()
 
     def convertModifier(self, pressedModifiers):
         modifierTextList = []
@@ -115,7 +146,9 @@ class GraphicsView(QGraphicsView):
 class App(QWidget):
     cleanupEvent = pyqtSignal()
 
-    def __init__(self, resources):
+    def __init__(self, resources, findPorts=None, openPort=None, audioEngine=None, shared=None, seatNumber=0):
+        # findPorts, openPort and audioEngine replace the serial and audio backends (used by Benchmark.py)
+        # the seats of a multi-seat game are given the first seat's shared resources
         super().__init__()
         self.versionNumber = '1.2.7'
         self.title = 'Monkey See Monkey Do   v'+self.versionNumber
@@ -124,6 +157,13 @@ class App(QWidget):
         self.width = 640
         self.height = 100
         self.folderName = ''
+        self.contentPack = None
+        self.validating = False
+        self.contentManifest = None
+        self.validatedLevels = {}  # level folder -> LevelInfo of the selected content
+        self.contentLevelFolders = []
+        self.changedLevels = set()
+        self.contentChangePending = False
         self.imageList = []
         self.numImages = 0
         self.currentImageNumber = 0
@@ -134,18 +174,42 @@ class App(QWidget):
         self.currentHotSpot = None
         self.startTime = None
         self.endTime = None
+        self.seatDialog = None  # level or game end message box of this seat while it is open
+        self.clock = time.time  # replaced by the session replay, which runs on the recorded time
         self.robot = []
+        self.robotWriters = []
+        self.lastPowerCommand = None
         self.screen = QDesktopWidget().availableGeometry()
         self.platform = platform.name()
+        self.modifierLookup = buildModifierLookup(self.platform)
         self.resources = resources
-        print(self.screen)
-        print('Operating System: ', self.platform)
-        print('Screen: width:', self.screen.width(), 'height:', self.screen.height())
+        self.portFinder = findPorts or self.findPorts
+        self.portOpener = openPort or openBaseStation
+        self.audioEngine = audioEngine
+        self.shared = shared
+        self.seatNumber = seatNumber
         self.initUI()
 
     def initUI(self):
 
         self.readConfig()
+        if self.shared is None:
+            self.shared = SharedResources(self, self.portFinder, self.portOpener, self.audioEngine)
+            log.info('MSMD %s', self.versionNumber)
+            log.info('Operating System: %s', self.platform)
+            log.info('Screen: width: %s height: %s', self.screen.width(), self.screen.height())
+        if self.numSeats > 1:
+            self.title += '   Seat %s' % (self.seatNumber+1)
+            # every seat keeps its timings and sessions apart
+            self.profileFolder = os.path.join(self.profileFolder, 'seat%s' % (self.seatNumber+1))
+            self.sessionFolder = os.path.join(self.sessionFolder, 'seat%s' % (self.seatNumber+1))
+        # levels, images and sounds are loaded once and shared read-only by all seats
+        self.imageCache = self.shared.imageCache
+        self.levelStore = self.shared.levelStore
+        self.soundCache = self.shared.soundCache
+        self.audioEngine = self.shared.audioEngine
+        self.prefetcher = ImagePrefetcher(self.prefetchDepth, self.imageCache, parent=self)
+        self.levelSounds = {}
 
         self.portLabel = QLabel('Port(s): ', self)
         self.portDisplay = QLineEdit(self)
@@ -163,7 +227,18 @@ class App(QWidget):
         self.settingsButton.clicked.connect(self.openSettings)
 
         self.connected = False
-        self.refreshPorts()
+        # base stations are found and opened in the background, also while a game is
+        # running, and handed to the seats by the shared resources (see addSeat below)
+        self.portMonitor = self.shared.portMonitor
+        # in a race the server drives the base stations (see RaceServer.py)
+        self.raceClient = None
+        if self.raceServer:
+            raceStations = [port.strip() for port in self.raceStation.split(',')]
+            raceStation = raceStations[self.seatNumber] if self.seatNumber < len(raceStations) else ''
+            self.raceClient = RaceClient(self.raceServer, self.title, raceStation, self.portScanInterval, parent=self)
+            self.raceClient.stationChanged.connect(self.raceStationChanged)
+            self.portRefreshButton.setEnabled(False)
+            self.raceClient.start()
         if self.showReferenceCreator:
             self.referenceCreator = QPushButton('Create Reference', self)
             self.referenceCreator.setToolTip('Create a reference file from the selected image set')
@@ -174,6 +249,10 @@ class App(QWidget):
         self.folderButton.setToolTip('Select the folder that contains the content you would like to play')
         self.folderButton.clicked.connect(self.folderButtonClicked)
 
+        self.packButton = QPushButton('Select Pack', self)
+        self.packButton.setToolTip('Select a content pack file (%s) created with PackContent.py' % PACK_EXTENSION)
+        self.packButton.clicked.connect(self.packButtonClicked)
+
         self.folderLabel = QLabel('Selected Folder:', self)
 
         self.selectedFolder = QLineEdit(self)
@@ -187,6 +266,10 @@ class App(QWidget):
         self.numImagesDisplay = QLineEdit(self)
         self.numImagesDisplay.setEnabled(False)
 
+        self.validationProgress = QProgressBar(self)
+        self.validationProgress.setFormat('Checking levels: %v/%m')
+        self.validationProgress.hide()
+
         self.startLabel = QLabel('Press "Start" to begin game', self)
 
         self.startButton = QPushButton('Start', self)
@@ -214,10 +297,15 @@ class App(QWidget):
 
         self.vbox = QVBoxLayout()
         self.vbox.addLayout(self.hboxPort)
-        self.vbox.addWidget(self.folderButton)
+        self.hboxContent = QHBoxLayout()
+        self.hboxContent.addWidget(self.folderButton)
+        self.hboxContent.addWidget(self.packButton)
+
+        self.vbox.addLayout(self.hboxContent)
         self.vbox.addLayout(self.hbox)
         self.vbox.addLayout(self.hboxNumLevels)
         self.vbox.addLayout(self.hboxNumImages)
+        self.vbox.addWidget(self.validationProgress)
         if self.showReferenceCreator:
             self.vbox.addWidget(self.referenceCreator)
         self.vbox.addWidget(self.startLabel)
@@ -227,10 +315,17 @@ class App(QWidget):
         self.startPage = QWidget()
         self.startPage.setLayout(self.vbox)
 
-        self.scene = QGraphicsScene()
+        self.scene = GameScene(self)
         self.graphicsView = GraphicsView(self.scene)
         self.graphicsView.itemClickedEvent.connect(self.hotSpotClickedHandler)
         self.graphicsView.keyPressed.connect(self.keyPressedHandler)
+        self.profiler = LatencyProfiler(self.profileBufferSize) if self.profiling else None
+        self.graphicsView.profiler = self.profiler
+        self.recorder = SessionRecorder(self, self.sessionFolder) if self.recordSessions else None
+        self.graphicsView.recorder = self.recorder
+        # authors can edit the selected content folder without selecting it again
+        self.contentWatcher = ContentWatcher(self.hotSpotFilename, parent=self)
+        self.contentWatcher.levelsChanged.connect(self.contentLevelsChanged)
 
         self.graphicsLayout = QVBoxLayout()
         self.graphicsLayout.addWidget(self.graphicsView)
@@ -243,12 +338,15 @@ class App(QWidget):
         self.stackedLayout.addWidget(self.startPage)
         self.stackedLayout.addWidget(self.gamePage)
         self.stackedLayout.setCurrentIndex(0)
+        # the content is only polled on the home screen, so the stat calls never delay an input
+        self.stackedLayout.currentChanged.connect(lambda index: self.contentWatcher.setPolling(index == 0))
 
         self.setLayout(self.stackedLayout)
         self.setWindowTitle(self.title)
         self.setGeometry(self.left, self.top, self.width, self.height)
         self.setWindowIcon(QIcon(self.resources['icoMSMD']))
         self.cleanupEvent.connect(self.cleanupStuff)
+        self.shared.addSeat(self)
         self.show()
         self.bringToFront()
 
@@ -265,11 +363,33 @@ class App(QWidget):
         self.upgradeMode = self.robotSettings['upgradeMode']
         self.minPowerToMove = self.robotSettings['minPowerToMove']
         self.maxPowerToMove = self.robotSettings['maxPowerToMove']
+        self.portScanInterval = float(self.robotSettings.get('port_scan_interval', '2'))
 
         # app settings
         self.showReferenceCreator = int(self.appSettings.get('showReferenceCreator', '1'))
         self.timeLimitMultiplier = float(self.appSettings.get('time_limit_multiplier', '1'))
         self.levelToUnlock = int(self.appSettings.get('level_to_unlock', '0'))
+        self.prefetchDepth = int(self.appSettings.get('prefetch_depth', '3'))
+        self.imageCacheSize = int(self.appSettings.get('image_cache_mb', '128'))*1024*1024
+        self.soundCacheSize = int(self.appSettings.get('sound_cache_mb', '64'))*1024*1024
+        self.levelStoreSize = int(self.appSettings.get('level_cache_mb', '1024'))*1024*1024
+        self.profiling = int(self.appSettings.get('profiling', '0'))
+        self.profileBufferSize = int(self.appSettings.get('profile_buffer_size', '10000'))
+        self.profileFolder = self.appSettings.get('profile_folder', '') or os.path.join(defaultCacheFolder(), 'profiles')
+        self.logLevel = self.appSettings.get('log_level', 'info')
+        self.logFolder = self.appSettings.get('log_folder', '') or os.path.join(defaultCacheFolder(), 'logs')
+        self.logConsole = int(self.appSettings.get('log_console', '1'))
+        self.numSeats = max(1, int(self.appSettings.get('seats', '1')))
+        self.seatPorts = [port.strip() for port in self.robotSettings.get('seat_ports', '').split(',') if port.strip()]
+        self.raceServer = self.robotSettings.get('race_server', '').strip()
+        self.raceStation = self.robotSettings.get('race_station', '').strip()
+        # decoded images kept per level: the current step, the prefetched ones and the end screen of every seat
+        self.decodedImageWindow = (self.prefetchDepth+2)*self.numSeats
+        self.recordSessions = int(self.appSettings.get('record_sessions', '0'))
+        self.watchContent = int(self.appSettings.get('watch_content', '1'))
+        self.useContentManifest = int(self.appSettings.get('content_manifest', '1'))
+        self.manifestFolder = self.appSettings.get('manifest_folder', '') or os.path.join(defaultCacheFolder(), 'manifests')
+        self.sessionFolder = self.appSettings.get('session_folder', '') or os.path.join(defaultCacheFolder(), 'sessions')
 
     def writeConfig(self):
         self.robotSettings['upgradeTrigger'] = self.upgradeTrigger
@@ -292,13 +412,13 @@ class App(QWidget):
             self.settingsWindow.show()
             self.setDisabled(True)
         except:
-            print('ERROR - Setting.py Load Failed!')
+            log.exception('Setting.py Load Failed!')
 
     def settingsClosed(self, message):
         if(message == 'Abort'):
-            print('Settigns Aborted!')
+            log.info('Settings Aborted!')
         elif(message == 'Closed'):
-            print('Settings Closed!')
+            log.info('Settings Closed!')
             # Set New Settings
             newSettings = self.settingsWindow.getSettings()
             self.upgradeTrigger = newSettings['upgradeTrigger']
@@ -307,7 +427,7 @@ class App(QWidget):
             self.maxPowerToMove = newSettings['maxPowerToMove']
             self.writeConfig()
         else:
-            print('ERROR - Unknown message returned from Settings.py Window!')
+            log.error('Unknown message returned from Settings.py Window: %s', message)
         self.setDisabled(False)
 
     def bringToFront(self):
@@ -315,104 +435,272 @@ class App(QWidget):
         self.activateWindow()
 
     def refreshPorts(self):
-        if(self.connected):
-            for baseStation in self.robot:
-                baseStation.close()
-        comPorts = self.findPorts()
-        if(comPorts):
-            self.robot = []
-            self.portDisplayText = ''
-            for i, port in enumerate(comPorts):
-                self.robot.append(serial.Serial(port))
-                self.robot[i].baudrate = 115200
-                self.robot[i].timeout = 0.05
-                self.portDisplayText += (port + '  ')
-            self.portDisplay.setText(self.portDisplayText)
-            self.connected = True
-        else:
-            self.robot = []
-            self.connected = False
+        # the port monitor keeps the stations that are still plugged in open and only opens new ones
+        self.portMonitor.rescan()
+
+    def baseStationAttached(self, port, baseStation):
+        log.info('base station attached: %s', port)
+        self.robot.append(baseStation)
+        writer = BaseStationWriter(baseStation)
+        if self.lastPowerCommand is not None:
+            # a station plugged in during a game gets the current power level right away
+            writer.send(self.lastPowerCommand)
+        self.robotWriters.append(writer)
+        self.baseStationsChanged()
+
+    def baseStationDetached(self, port):
+        log.info('base station detached: %s', port)
+        for i, baseStation in enumerate(self.robot):
+            if baseStation.port == port:
+                self.robotWriters.pop(i).stop()
+                self.robot.pop(i).close()
+                break
+        self.baseStationsChanged()
+
+    def baseStationsChanged(self):
+        self.portDisplayText = ''
+        for baseStation in self.robot:
+            self.portDisplayText += (baseStation.port + '  ')
+        self.portDisplay.setText(self.portDisplayText)
+        self.connected = bool(self.robot)
+
+    def raceStationChanged(self, port):
+        self.portDisplay.setText('race server: %s' % (port or 'no base station'))
+        self.connected = bool(port)
+
+    def stopRobotWriters(self):
+        for writer in self.robotWriters:
+            writer.stop()
+        self.robotWriters = []
 
     def folderButtonClicked(self):
         # get folder with content in it from user
-        self.folderName = QFileDialog.getExistingDirectory(self, "Select Folder Location for Recorded Content")
-        print(self.folderName)
-        if os.path.isdir(self.folderName):  # If it is a valid folder
+        self.selectContent(QFileDialog.getExistingDirectory(self, "Select Folder Location for Recorded Content"))
+
+    def packButtonClicked(self):
+        # get content pack file from user
+        packFileName, _ = QFileDialog.getOpenFileName(self, "Select Content Pack", '', 'MSMD content pack (*%s)' % PACK_EXTENSION)
+        if packFileName:
+            self.selectContent(packFileName)
+
+    def selectContent(self, folderName):
+        if self.contentPack is not None:
+            self.contentPack.close()
+            self.contentPack = None
+        self.folderName = folderName
+        self.validatedLevels = {}
+        self.contentLevelFolders = []
+        self.changedLevels = set()
+        self.contentChangePending = False
+        self.contentWatcher.stop()
+        self.shared.contentSelected(self, self.folderName)
+        log.info('selected content: %s', self.folderName)
+        if isContentPack(self.folderName):
+            try:
+                self.contentPack = ContentPack(self.folderName)
+            except IOError:
+                QMessageBox.warning(self, 'Pack Error!', 'The content pack could not be read!\nPlease select a valid content pack', QMessageBox.Ok)
+                return
+        if self.contentPack is not None or os.path.isdir(self.folderName):  # If it is a valid folder or pack
+            # validate the levels in the background (images are only decoded when a level is played)
+            self.folderButton.setEnabled(False)
+            self.packButton.setEnabled(False)
+            self.startButton.setEnabled(False)
+            if self.showReferenceCreator:
+                self.referenceCreator.setEnabled(False)
+            self.selectedFolder.setText(self.folderName)
+            self.validationProgress.setValue(0)
+            self.validationProgress.show()
+            if self.contentPack is None and self.watchContent:
+                self.contentWatcher.watch(self.folderName)
+            # unchanged levels of a folder selected before are taken from its manifest instead of being read again
+            self.contentManifest = None
+            if self.contentPack is None and self.useContentManifest:
+                self.contentManifest = ContentManifest(self.folderName, self.manifestFolder, self.hotSpotFilename)
+            self.validationThread = ValidationThread(self.folderName, self.hotSpotFilename, self.contentPack, manifest=self.contentManifest)
+            self.validationThread.progress.connect(self.validationProgressHandler)
+            self.validationThread.validated.connect(self.folderValidatedHandler)
+            self.validationThread.finished.connect(self.validationFinished)
+            self.validating = True
+            self.validationThread.start()
+        else:
+            QMessageBox.warning(self, 'Folder Error!', 'The folder does not exist!\nPlease select a valid folder', QMessageBox.Ok)
+
+    def validationProgressHandler(self, levelsDone, numLevels):
+        self.validationProgress.setMaximum(numLevels)
+        self.validationProgress.setValue(levelsDone)
+
+    def contentLevelsChanged(self, levelFolders, changedLevels):
+        # only the levels that changed are validated again and dropped from the shared caches,
+        # once the game is back on the home screen (see revalidateContent)
+        removedLevels = [levelFolder for levelFolder in self.validatedLevels if levelFolder not in levelFolders]
+        log.info('content changed: %s level(s) changed, %s removed', len(changedLevels), len(removedLevels))
+        self.changedLevels.update(changedLevels)
+        self.changedLevels.update(removedLevels)
+        self.contentLevelFolders = levelFolders
+        self.contentChangePending = True
+        self.revalidateContent()
+
+    def revalidateContent(self):
+        # changes wait until the game is back on the home screen and no validation is running
+        if not self.contentChangePending or self.stackedLayout.currentIndex() != 0:
+            return
+        if self.validating:
+            return
+        self.contentChangePending = False
+        for levelFolder in self.changedLevels:
+            self.validatedLevels.pop(levelFolder, None)
+            self.shared.invalidateLevel(levelFolder)
+        self.changedLevels = set()
+        levelFolders = [levelFolder for levelFolder in self.contentLevelFolders if levelFolder not in self.validatedLevels]
+        if not levelFolders:
+            self.levelsRevalidatedHandler([])
+            return
+        self.folderButton.setEnabled(False)
+        self.packButton.setEnabled(False)
+        self.startButton.setEnabled(False)
+        self.validationThread = ValidationThread(self.folderName, self.hotSpotFilename, levelFolders=levelFolders, manifest=self.contentManifest)
+        self.validationThread.validated.connect(self.levelsRevalidatedHandler)
+        self.validationThread.finished.connect(self.validationFinished)
+        self.validating = True
+        self.validationThread.start()
+
+    def validationFinished(self):
+        self.validating = False
+        self.revalidateContent()
+
+    def levelsRevalidatedHandler(self, levelInfoList):
+        for levelInfo in levelInfoList:
+            self.validatedLevels[levelInfo.folder] = levelInfo
+        if not self.contentLevelFolders:
+            self.folderButton.setEnabled(True)
+            self.packButton.setEnabled(True)
+            self.startButton.setEnabled(False)
+            QMessageBox.warning(self, 'Folder Error!', 'The selected folder was removed!\nPlease select a valid folder', QMessageBox.Ok)
+            return
+        self.folderValidatedHandler([self.validatedLevels[levelFolder] for levelFolder in self.contentLevelFolders])
+
+    def folderValidatedHandler(self, levelInfoList):
+        self.validationProgress.hide()
+        self.folderButton.setEnabled(True)
+        self.packButton.setEnabled(True)
+        # kept so a change to the content only validates the levels that changed
+        self.validatedLevels = {levelInfo.folder: levelInfo for levelInfo in levelInfoList}
+        if not self.contentLevelFolders:
+            self.contentLevelFolders = [levelInfo.folder for levelInfo in levelInfoList]
+        for levelInfo in levelInfoList:
+            if(levelInfo.error):  # if a folder is not a valid level, quit this function
+                self.showLevelError(levelInfo)
+                return
+        self.levelInfoList = levelInfoList
+        self.numTotalImages = sum(levelInfo.numImages for levelInfo in levelInfoList)
+        if(levelInfoList[0].folder != self.folderName):
+            # multiLevel game selected
+            self.numLevels = len(levelInfoList)
+            self.folderList = [levelInfo.folder for levelInfo in levelInfoList]
+            self.folderListNameOnly = [levelInfo.name for levelInfo in levelInfoList]  # level folders are named in the order they will be played in
+            self.numLevelsDisplay.setText(str(self.numLevels))  # display the number of levels in the selected folder
+        else:
+            # single level selected
             self.numLevels = 0
-            self.numTotalImages = 0
-            self.listOfFilesInSelectedFolder = os.listdir(self.folderName)
             self.folderList = []
             self.folderListNameOnly = []
-            for name in self.listOfFilesInSelectedFolder:
-                fullFileName = os.path.join(self.folderName, name)
-                if os.path.isdir(fullFileName):
-                    result = self.loadLevel(fullFileName)  # load each level to make sure it is valid
-                    if(result < 0):  # if the folder is not a valid level, quit this function
-                        return
-                    self.folderList.append(fullFileName)
-                    self.folderListNameOnly.append(name)
-                    self.numLevels += 1
-                    self.numTotalImages += result
-            self.folderListNameOnly = sorted(self.folderListNameOnly)  # sort the resulting list of level folders (they should be named in order they will be played in)
-            if(self.numLevels > 0):
-                # multiLevel game selected
-                self.loadLevel(self.folderList[0])  # load the first level
-                self.numLevelsDisplay.setText(str(self.numLevels))  # display the number of levels in the selected folder
+            self.numLevelsDisplay.setText('1')
+        if(self.levelToUnlock>self.numLevels):
+            if(self.numLevels == 0):
+                self.levelToUnlock = 0
             else:
-                # single level selected
-                result = self.loadLevel(self.folderName)  # try to load the single level selected
-                if(result < 0):  # if level is invalid, quit this function
-                    return
-                self.numTotalImages = result
-                self.numLevelsDisplay.setText('1')
-            if(self.levelToUnlock>self.numLevels):
-                if(self.numLevels == 0):
-                    self.levelToUnlock = 0
-                else:
-                    self.levelToUnlock = self.numLevels-1
-            self.currentLevel = 0
-            self.numImagesDisplay.setText(str(self.numTotalImages))
-            self.startButton.setEnabled(True)
-            if self.showReferenceCreator:
-                self.referenceCreator.setEnabled(True)
-            self.selectedFolder.setText(self.folderName)
+                self.levelToUnlock = self.numLevels-1
+        self.currentLevel = 0
+        self.numImagesDisplay.setText(str(self.numTotalImages))
+        self.startButton.setEnabled(True)
+        if self.showReferenceCreator:
+            self.referenceCreator.setEnabled(True)
+        self.selectedFolder.setText(self.folderName)
+
+    def showLevelError(self, levelInfo):
+        if(levelInfo.error == ERROR_HOTSPOTS):
+            QMessageBox.critical(self, 'Error: No hotspots.json', 'hotspots.json does not exist\nA Hot Spot file is required to play the game. Please select a complete and valid content folder', QMessageBox.Ok)
+            self.selectedFolder.setText('Error: No hotspots.json')
+        elif(levelInfo.error == ERROR_IMAGES):
+            QMessageBox.critical(self, 'Error: images reading', 'Images could not be read\nPlease select a complete and valid content folder', QMessageBox.Ok)
         else:
-            QMessageBox.warning(self, 'Folder Error!', 'The folder does not exist!\nPlease select a valid folder', QMessageBox.Ok)
+            QMessageBox.critical(self, 'Error: Image Hotspot Mismatch', 'Error: number of images in level "'+str(levelInfo.folder)+'" do not match the number of hot spot records', QMessageBox.Ok)
+
+    def loadFirstLevel(self):
+        if(self.numLevels > 0):
+            return self.loadLevel(self.folderList[0])
+        else:
+            return self.loadLevel(self.folderName)
 
     def loadLevel(self, levelToLoad):
+        # levels that were played before come from the level store (no file reads, no decoding)
+        level = self.levelStore.get(levelToLoad)
+        if level is None:
+            if self.contentPack is not None:
+                level = self.readPackLevel(levelToLoad)
+            else:
+                level = self.readFolderLevel(levelToLoad)
+            if level is None:
+                return -1
+            self.levelStore.put(levelToLoad, level)
+        self.hotSpotTable = level.hotSpotTable
+        self.numHotSpotRecords = len(self.hotSpotTable)
+        self.imageList = level.imageList
+        if self.contentPack is not None:
+            return self.levelLoaded(levelToLoad, self.findPackSounds)
+        return self.levelLoaded(levelToLoad, self.findFolderSounds)
+
+    def readFolderLevel(self, levelToLoad):
         try:
-            print('Trying to load '+levelToLoad)
+            log.info('Trying to load %s', levelToLoad)
             self.hotSpotFile = open(levelToLoad+os.path.sep+self.hotSpotFilename, 'r')
-            self.hotSpotDict = json.load(self.hotSpotFile)
-            self.numHotSpotRecords = len(self.hotSpotDict)
+            hotSpotTable = HotSpotTable(json.load(self.hotSpotFile))
             # self.hotSpotCsv = csv.reader(self.hotSpotFile)
             # next(self.hotSpotCsv)
             # self.numHotSpotRecords = sum(1 for row in self.hotSpotCsv)
             # self.hotSpotFile.seek(0)
             # next(self.hotSpotCsv) #skip column labels on first line
             self.hotSpotFile.close()
-            buildScanCodeTranslationTable(self.hotSpotDict)
         except IOError:
             QMessageBox.critical(self, 'Error: No hotspots.json', 'hotspots.json does not exist\nA Hot Spot file is required to play the game. Please select a complete and valid content folder', QMessageBox.Ok)
             self.selectedFolder.setText('Error: No hotspots.json')
-            return -1
-        self.imageList = []
+            return None
+        # only the png data is kept, images are decoded when they are shown
         try:
-            for imageFile in sorted((imfile for imfile in os.listdir(levelToLoad) if imfile.endswith('.png'))):
-
-                self.imageList.append(QImage(levelToLoad+os.path.sep+imageFile))
-
+            imageFiles = [levelToLoad+os.path.sep+imageFile for imageFile in sorted((imfile for imfile in os.listdir(levelToLoad) if imfile.endswith('.png')))]
+            imageList = EncodedImageList.fromFiles(imageFiles, self.decodedImageWindow)
         except IOError:
             QMessageBox.critical(self, 'Error: images reading', 'Images could not be read\nPlease select a complete and valid content folder', QMessageBox.Ok)
-            return -1
+            return None
+        return LoadedLevel(hotSpotTable, imageList)
+
+    def readPackLevel(self, levelToLoad):
+        # the pack index holds the hotspot table and the images are read straight from the mapped pack file
+        log.info('Trying to load %s from pack', levelToLoad)
+        hotSpotTable = HotSpotTable(self.contentPack.hotSpots(levelToLoad))
+        imageIndexes = range(self.contentPack.numImageBlobs(levelToLoad))
+        imageList = EncodedImageList([self.contentPack.imageData(levelToLoad, imageIndex) for imageIndex in imageIndexes], self.decodedImageWindow)
+        return LoadedLevel(hotSpotTable, imageList)
+
+    def levelLoaded(self, levelToLoad, findSoundSources):
+        # all of the level's sounds are decoded now so steps never read sound files
+        self.levelSounds = self.soundCache.loadLevel(levelToLoad, lambda: findSoundSources(levelToLoad))
+        self.graphicsView.textToScanCode = self.hotSpotTable.textToScanCode
         self.numImages = len(self.imageList)-1
+        self.prefetcher.setLevel(levelToLoad, self.imageList)
         if(self.numImages != self.numHotSpotRecords):
             QMessageBox.critical(self, 'Error: Image Hotspot Mismatch', 'Error: number of images in level "'+str(levelToLoad)+'" do not match the number of hot spot records', QMessageBox.Ok)
             return -1
         return self.numImages
 
     def startButtonClicked(self):
-        print('start')
+        log.info('start')
+        if self.recorder is not None:
+            self.recorder.beginSession(self.sessionMetadata())
+        self.currentLevel = 0
+        if(self.loadFirstLevel() < 0):
+            return
         self.stackedLayout.setCurrentIndex(1)
         self.paintImageIndex(0)
         self.showMaximized()
@@ -420,142 +708,84 @@ class App(QWidget):
         if(self.upgradeTrigger == 'level'):
             self.setPower((int(self.minPowerToMove)*100)//255)
 
-        self.startTime = time.time()
+        self.startTime = self.clock()
 
     def paintImageIndex(self, imageNumber):
         if(self.upgradeTrigger == 'hotspot'):
             powerLevel = (self.currentTotalImageNumber/(self.numTotalImages-1))*100
-            print('power:', powerLevel, '  currentTotalImageNum:', self.currentTotalImageNumber, '  numTotalImages:', self.numTotalImages)
+            log.debug('power: %s  currentTotalImageNum: %s  numTotalImages: %s', powerLevel, self.currentTotalImageNumber, self.numTotalImages)
             self.setPower(powerLevel)
-        self.scene.clear()
-        print('current image number:', imageNumber)
-        self.nextHotSpotInput = self.hotSpotDict[str(self.currentImageNumber).zfill(6)]
-        print('nextHotSpotInput', self.nextHotSpotInput)
-        self.currentPixmap = QPixmap.fromImage(self.imageList[imageNumber]).copy(QRect(0, 0, 1920, 1020)).scaled(self.screen.width(), self.screen.height(), aspectRatioMode=Qt.IgnoreAspectRatio)
-
-        self.scene.addPixmap(self.currentPixmap)
-
-        self.currentInputModifiers = self.simplifyModifierList(self.nextHotSpotInput['modifiers'])
-
-        if(self.nextHotSpotInput['type'] == 'mouse'):
-            commandString = ''
-            if self.currentInputModifiers != []:
-                commandString += 'Press '
-            for mod in self.currentInputModifiers:
-                commandString += mod + ' + '
-            commandString += 'Click '
-            self.currentMouseButton = self.nextHotSpotInput['button']
-            if(self.currentMouseButton == 'right'):
-                pen = QPen(QColor(0, 0, 255, 128))
-                commandString += 'right mouse button'
-            elif(self.currentMouseButton == 'left'):
-                pen = QPen(QColor(255, 0, 0, 128))
-                commandString += 'left mouse button'
-            elif(self.currentMouseButton == 'middle'):
-                pen = QPen(QColor(0, 255, 0, 128))
-                commandString += 'scroll wheel (middle mouse button)'
-            else:
-                pen = QPen(QColor(0, 0, 0, 128))
-            xScale = self.screen.width()/1920
-            yScale = self.screen.height()/1020
-            if(xScale > yScale):
-                minScale = yScale
-            else:
-                minScale = xScale
-            scaledHotSpotSize = self.hotSpotSize*minScale
-            xPosition = self.nextHotSpotInput['position'][0]*xScale
-            yPosition = self.nextHotSpotInput['position'][1]*yScale
-            # adjust yPosition
-            yPosition += 30
-            print('next hotspot pos x %s y %s' % (xPosition, yPosition))
-            brush = QBrush(QColor(180, 180, 180, 100))
-            self.currentHotSpot = QGraphicsEllipseItem()
-            self.currentHotSpot.setRect(xPosition-scaledHotSpotSize/2, yPosition-scaledHotSpotSize/2, scaledHotSpotSize, scaledHotSpotSize)
-            self.currentHotSpot.setBrush(brush)
-            self.currentHotSpot.setPen(pen)
-            self.scene.addItem(self.currentHotSpot)
+            if self.profiler is not None:
+                self.profiler.mark('setPower')
+        log.debug('current image number: %s', imageNumber)
+        # the image was (usually) already cropped and scaled by the prefetcher
+        self.currentPixmap = QPixmap.fromImage(self.prefetcher.take(imageNumber))
+        if self.profiler is not None:
+            self.profiler.mark('image')
+
+        self.scene.setBackground(self.currentPixmap)
+        self.prefetcher.prefetch(imageNumber+1)
+
+        # everything about the step comes from the level's compiled hotspot table
+        table = self.hotSpotTable
+        stepType = table.types[imageNumber]
+        self.currentModifierMask = table.modifiers[imageNumber]
+
+        if(stepType == STEP_MOUSE):
+            self.currentMouseButton = table.buttons[imageNumber]
+            log.debug('next hotspot pos x %s y %s', table.x[imageNumber], table.y[imageNumber])
+            # the scene keeps one hotspot item that is moved to the new position (in recorded coordinates)
+            self.scene.showHotSpot(table.x[imageNumber], table.y[imageNumber], self.hotSpotSize, table.buttonNames[imageNumber])
+            self.currentHotSpot = self.scene.hotSpot
             self.currentInputKey = -1
-        elif(self.nextHotSpotInput['type'] == 'key'):
-            # print('key')
-            self.currentInputKey = self.nextHotSpotInput['scancode']
-            commandString = 'Press '
-            for mod in self.currentInputModifiers:
-                commandString += mod
-                commandString += ' + '
-            commandString += self.nextHotSpotInput['name']
+        elif(stepType == STEP_KEY):
+            self.currentInputKey = table.scancodes[imageNumber]
+            self.scene.hideHotSpot()
             self.currentHotSpot = 'not a hotspot'
         else:
-            QMessageBox.critical(self, 'Error: hotSpotInput type is incorrect. got: "'+self.nextHotSpotInput['type']+'"  expected: "key" or "mouse"', QMessageBox.Ok)
+            QMessageBox.critical(self, 'Error: Hot Spot Type', 'Error: hotSpotInput type is incorrect. got: "'+table.typeNames[imageNumber]+'"  expected: "key" or "mouse"', QMessageBox.Ok)
+            return
 
-        self.setWindowTitle(self.title + '       ' + commandString)
+        self.setWindowTitle(self.title + '       ' + table.commandStrings[imageNumber])
+        if self.profiler is not None:
+            self.profiler.stepPainted(self.currentLevel, imageNumber)
 
     def playSound(self):
-
-        class SoundThread(QThread):
-            signal = pyqtSignal('PyQt_PyObject')
-
-            def __init__(self, soundFilename):
-                super().__init__()
-
-                self.soundFilename = soundFilename
-
-            def run(self):
-
-                # define stream chunk
-                chunk = 1024
-
-                # open a wav format music
-                f = wave.open(self.soundFilename, "rb")
-                # instantiate PyAudio
-                p = pyaudio.PyAudio()
-                # open stream
-                stream = p.open(format=p.get_format_from_width(f.getsampwidth()),
-                                channels=f.getnchannels(),
-                                rate=f.getframerate(),
-                                output=True)
-                # read data
-                data = f.readframes(chunk)
-
-                # play stream
-                while data:
-                    stream.write(data)
-                    data = f.readframes(chunk)
-
-                # stop stream
-                stream.stop_stream()
-                stream.close()
-
-                # close PyAudio
-                p.terminate()
-                self.signal.emit(soundFilename)
-
-        subFolder = ''
-        if self.folderListNameOnly:
-            subFolder = '%s%s' % (self.folderListNameOnly[self.currentLevel], os. path.sep)
-        soundFilename = '%s%s%ssound%s.wav'% (self.folderName, os.path.sep, subFolder, self.currentImageNumber)
-
-        if not os.path.isfile(soundFilename):
-            return
-        try:
-            self.soundThread = SoundThread(soundFilename)
-            self.soundThread.signal.connect(self.soundFinished)
-            self.soundThread.start()
-        except:
-            print('something when wrong with the sound thread')
-
-    def soundFinished(self, soundFile):
-        print('finished playing %s' % soundFile)
+        # the level's sounds were loaded with the level (see levelLoaded)
+        samples = self.levelSounds.get(self.currentImageNumber)
+        if samples is not None:
+            self.audioEngine.play(samples)
+
+    def findFolderSounds(self, levelFolder):
+        soundSources = {}
+        for fileName in os.listdir(levelFolder):
+            match = SOUND_FILE_PATTERN.match(fileName)
+            if match:
+                soundSources[int(match.group(1))] = os.path.join(levelFolder, fileName)
+        return soundSources
+
+    def findPackSounds(self, levelFolder):
+        soundSources = {}
+        for soundNumber in self.contentPack.level(levelFolder)['sounds']:
+            soundSources[int(soundNumber)] = io.BytesIO(self.contentPack.soundData(levelFolder, soundNumber))
+        return soundSources
 
     def hotSpotClickedHandler(self, itemClicked, modifiers, mouseButton):
+        if self.seatDialog is not None:
+            return
 
-        print('itemClicked %s, self.currentHotSpot %s, mouseButton %s' % (itemClicked, self.currentHotSpot, mouseButton))
+        log.debug('itemClicked %s, self.currentHotSpot %s, mouseButton %s', itemClicked, self.currentHotSpot, mouseButton)
 
         if itemClicked is self.currentHotSpot:
             if self.checkModifierMatch(modifiers):
                 if self.checkButtonMatch(mouseButton):
                     # print('clicked on hot spot!')
+                    if self.profiler is not None:
+                        self.profiler.mark('match')
 
                     self.playSound()
+                    if self.profiler is not None:
+                        self.profiler.mark('playSound')
 
                     self.currentImageNumber += 1
                     self.currentTotalImageNumber += 1
@@ -574,21 +804,20 @@ class App(QWidget):
             pass
 
     def checkButtonMatch(self, pressedMouseButton):
-        if pressedMouseButton == Qt.LeftButton:
-            pressedMouseButtonString = 'left'
-        if pressedMouseButton == Qt.RightButton:
-            pressedMouseButtonString = 'right'
-        if pressedMouseButton == Qt.MiddleButton:
-            pressedMouseButtonString = 'middle'
-
-        return self.currentMouseButton == pressedMouseButtonString
+        return int(pressedMouseButton) == self.currentMouseButton
 
     def keyPressedHandler(self, nativeScanCode, keyText, modifiers):
-        print('scanCode %s, currentInputKey %s' % (nativeScanCode, self.currentInputKey))
+        if self.seatDialog is not None:
+            return
+        log.debug('scanCode %s, currentInputKey %s', nativeScanCode, self.currentInputKey)
         if (nativeScanCode == self.currentInputKey) and self.checkModifierMatch(modifiers):
             # print('pressed correct key (or key combination)')
+            if self.profiler is not None:
+                self.profiler.mark('match')
 
             self.playSound()
+            if self.profiler is not None:
+                self.profiler.mark('playSound')
 
             self.currentImageNumber += 1
             self.currentTotalImageNumber += 1
@@ -601,47 +830,16 @@ class App(QWidget):
             pass
 
     def checkModifierMatch(self, pressedModifiers):
-        modifierTextList = []
-        if(pressedModifiers & Qt.ShiftModifier):
-            modifierTextList.append('shift')
-        if(pressedModifiers & Qt.AltModifier):
-            modifierTextList.append('alt')
-
-        # handle key differences for mac
-        if(self.platform in ['Windows', 'Linux']):
-            if(pressedModifiers & Qt.ControlModifier):
-                modifierTextList.append('ctrl')
-            if(pressedModifiers & Qt.MetaModifier):
-                modifierTextList.append('win')
-        else:
-            if(pressedModifiers & Qt.ControlModifier):
-                modifierTextList.append('cmd')  # on the mac this is the command key
-            if(pressedModifiers & Qt.MetaModifier):
-                modifierTextList.append('ctrl')  # on the mac this is the control key
-        return set(modifierTextList) == set(self.currentInputModifiers)
-
-    def simplifyModifierList(self, modifierList):
-        tempSet = set()
-        for item in modifierList:
-            if item == 'left shift':
-                tempSet.add('shift')
-            elif item == 'right shift':
-                tempSet.add('shift')
-            elif item == 'left ctrl':
-                tempSet.add('ctrl')
-            elif item == 'right ctrl':
-                tempSet.add('ctrl')
-            elif item == 'left alt':
-                tempSet.add('alt')
-            elif item == 'right alt':
-                tempSet.add('alt')
-            else:
-                tempSet.add(item)
-        return list(tempSet)
+        return pressedModifierMask(self.modifierLookup, pressedModifiers) == self.currentModifierMask
 
     def levelCompleted(self):
-        self.levelTime = time.time()-self.startTime
-        print('completed level: ', self.currentLevel+1)
+        self.levelTime = self.clock()-self.startTime
+        log.info('completed level: %s', self.currentLevel+1)
+        log.info('image cache: %s', self.imageCache.stats())
+        log.info('sound cache: %s', self.soundCache.stats())
+        log.info('level store: %s', self.levelStore.stats())
+        for writer in self.robotWriters:
+            log.info('base station: %s', writer.stats())
 
         if(self.upgradeTrigger == 'level'):
             powerLevel = (self.currentLevel/(self.numLevels-1))*100
@@ -649,10 +847,10 @@ class App(QWidget):
 
         timeToBeat = (self.currentTotalImageNumber)*self.timeLimitMultiplier
         if(self.currentLevel == self.levelToUnlock):
-            print('unlockLevel?')
+            log.info('unlockLevel?')
             # if the level was completed fast enough to move on
             if(self.levelTime <= timeToBeat):
-                print('levelUnlocked')
+                log.info('levelUnlocked')
                 # (next level is all levels compounded...)
                 # if the level completed was the last level
                 if(self.currentLevel >= self.numLevels-1):
@@ -662,36 +860,16 @@ class App(QWidget):
                     self.levelToUnlock += 1
                     # otherwise ask the user if they want to play the next
                     # level or quit
-                    buttonReply = QMessageBox.question(
-                        self,
+                    self.showSeatDialog(
+                        QMessageBox.Question,
                         'You Beat Level ' + str(self.currentLevel+1),
                         'You Beat the level!\nYou completed the level in ' + "%.2f" % self.levelTime + ' seconds out of ' + "%.2f" % timeToBeat + '\nPlay next level?',
-                        QMessageBox.Yes | QMessageBox.Cancel)
-                    if(buttonReply == QMessageBox.Cancel):
-                        # quit game and go back to home screen
-                        self.returnToHomeScreen()
-                    else:
-                        # restart (but with next level unlocked)
-                        self.currentLevel = 0
-                        self.currentImageNumber = 0
-                        self.currentTotalImageNumber = 0
-                        self.loadLevel(self.folderList[self.currentLevel])
-                        self.paintImageIndex(0)
+                        QMessageBox.Yes | QMessageBox.Cancel,
+                        self.levelDialogAnswered)
             else:
-                print('levelFailed')
+                log.info('levelFailed')
                 # display dialog; complete in X time to advance to next level.  Replay?  Quit?
-                buttonReply = QMessageBox.information(self, 'Too Slow...', 'You were not fast enough.\nYou completed the level in ' + "%.2f" % (self.levelTime) + ' seconds\nFinish in ' + "%.2f" % timeToBeat + ' seconds or less to move on.', QMessageBox.Ok | QMessageBox.Cancel)
-                if(buttonReply == QMessageBox.Cancel):
-                    # quit game and go back to home screen
-                    self.returnToHomeScreen()
-                else:
-                    # restart
-                    self.currentLevel = 0
-                    self.currentImageNumber = 0
-                    self.currentTotalImageNumber = 0
-                    self.loadLevel(self.folderList[self.currentLevel])
-                    self.paintImageIndex(0)
-            self.startTime = time.time()
+                self.showSeatDialog(QMessageBox.Information, 'Too Slow...', 'You were not fast enough.\nYou completed the level in ' + "%.2f" % (self.levelTime) + ' seconds\nFinish in ' + "%.2f" % timeToBeat + ' seconds or less to move on.', QMessageBox.Ok | QMessageBox.Cancel, self.levelDialogAnswered)
         else:
             # play next level
             self.currentLevel += 1
@@ -699,171 +877,173 @@ class App(QWidget):
             self.loadLevel(self.folderList[self.currentLevel])
             self.paintImageIndex(0)
 
+    def showSeatDialog(self, icon, title, text, buttons, answered):
+        # window modal and without a nested event loop, so the other seats keep running;
+        # answered gets the button that was clicked once the dialog is closed
+        dialog = QMessageBox(icon, title, text, buttons, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.finished.connect(lambda result: self.seatDialogFinished(dialog, result, answered))
+        self.seatDialog = dialog
+        dialog.open()
+
+    def seatDialogFinished(self, dialog, result, answered):
+        self.seatDialog = None
+        dialog.deleteLater()
+        answered(result)
+        # the input that opened the dialog is handled once the dialog is answered
+        if self.recorder is not None:
+            self.recorder.inputHandled()
+
+    def levelDialogAnswered(self, result):
+        if(result == QMessageBox.Cancel):
+            # quit game and go back to home screen
+            self.returnToHomeScreen()
+            return
+        # restart (with the next level unlocked if it was beaten)
+        self.currentLevel = 0
+        self.currentImageNumber = 0
+        self.currentTotalImageNumber = 0
+        self.loadLevel(self.folderList[self.currentLevel])
+        self.paintImageIndex(0)
+        self.startTime = self.clock()
+
     def returnToHomeScreen(self):
-        print('returning to home screen')
+        log.info('returning to home screen')
         self.setWindowTitle(self.title)
-        self.scene.clear()
+        self.scene.clearStep()
         self.currentHotSpot = None
         self.currentImageNumber = 0
         self.currentTotalImageNumber = 0
         self.stackedLayout.setCurrentIndex(0)
         self.showNormal()
-        if(self.numLevels > 0):
-            self.loadLevel(self.folderList[0])
-        else:
-            self.loadLevel(self.folderName)
         self.currentLevel = 0
+        self.exportProfile()
+        self.endSession()
+        self.revalidateContent()
 
     def gameCompleted(self):
-        self.endTime = time.time()
+        self.endTime = self.clock()
         timeToBeat = (self.currentTotalImageNumber)*self.timeLimitMultiplier
-        self.scene.clear()
+        self.scene.hideHotSpot()
         self.currentHotSpot = None
         self.currentImageNumber = 0
         self.currentTotalImageNumber = 0
         self.currentPixmap = None
-        self.currentPixmap = QPixmap.fromImage(self.imageList[self.numImages]).copy(QRect(0, 0, 1920, 1020)).scaled(self.screen.width(), self.screen.height(), aspectRatioMode=Qt.IgnoreAspectRatio)
-        self.scene.addPixmap(self.currentPixmap)
-        buttonReply = QMessageBox.information(self, 'You Win!', 'Congradulations, You Won!\nYou completed the game in ' + "%.2f" % (self.endTime-self.startTime) + ' seconds out of ' "%.2f" % timeToBeat, QMessageBox.Ok)
-        if buttonReply == QMessageBox.Ok:
-            self.setWindowTitle(self.title)
-            self.stackedLayout.setCurrentIndex(0)
-            self.showNormal()
-            if(self.numLevels > 0):
-                self.loadLevel(self.folderList[0])
-            else:
-                self.loadLevel(self.folderName)
-            self.currentLevel = 0
+        self.currentPixmap = QPixmap.fromImage(prepareImage(self.imageList[self.numImages]))
+        self.scene.setBackground(self.currentPixmap)
+        self.showSeatDialog(QMessageBox.Information, 'You Win!', 'Congradulations, You Won!\nYou completed the game in ' + "%.2f" % (self.endTime-self.startTime) + ' seconds out of ' "%.2f" % timeToBeat, QMessageBox.Ok, self.gameDialogAnswered)
 
-    def findPorts(self):
-        ports = list(serial.tools.list_ports.comports())
-        comPortsList = []
-        # microcontrollerPort = None
-        for port in ports:
-            if 'Silicon Labs' in str(port[1]):
-                comPortsList.append(port[0])
-        return comPortsList
+    def gameDialogAnswered(self, result):
+        # the game is over however the dialog was closed
+        self.setWindowTitle(self.title)
+        self.stackedLayout.setCurrentIndex(0)
+        self.showNormal()
+        self.currentLevel = 0
+        self.exportProfile()
+        self.endSession()
+        self.revalidateContent()
 
-    def setPower(self, powerLevel):
-        if(powerLevel > 100):
-            raise ValueError('powerLevel cannot be set above 100')
-        if(powerLevel < 0):
-            raise ValueError('powerLevel cannot be set below 0')
-
-        minPower = int(self.minPowerToMove)
-        mode = self.upgradeMode
-        leftPower = minPower
-        rightPower = minPower
-        maxPower = int(self.maxPowerToMove)
-        if(mode == "left"):
-            if(powerLevel <= 50):
-                leftPower = self.interpolate(powerLevel, 0, 100, minPower, maxPower)
-                rightPower = self.interpolate(powerLevel, 0, 50, minPower, maxPower)
-            else:
-                leftPower = self.interpolate(powerLevel, 0, 100, minPower, maxPower)
-                rightPower = self.interpolate(powerLevel, 50, 100, minPower, maxPower)
-        elif(mode == "right"):
-            if(powerLevel <= 50):
-                rightPower = self.interpolate(powerLevel, 0, 100, minPower, maxPower)
-                leftPower = self.interpolate(powerLevel, 0, 50, minPower, maxPower)
-            else:
-                rightPower = self.interpolate(powerLevel, 0, 100, minPower, maxPower)
-                leftPower = self.interpolate(powerLevel, 50, 100, minPower, maxPower)
-        elif(mode == "both"):
-            leftPower = self.interpolate(powerLevel, 0, 100, minPower, maxPower)
-            rightPower = leftPower
-        elif(mode == "distance"):
-            # add fuel to the robot "tank"
-            pass
+    def exportProfile(self):
+        # one csv/json pair of per-step timings per played session
+        if self.profiler is None:
+            return
+        fileName = self.profiler.export(self.profileFolder)
+        if fileName:
+            log.info('step timings written to %s', fileName)
+        self.profiler.reset()
+
+    def sessionMetadata(self):
+        # everything a replay needs to set the game up the same way
+        return {'appVersion': self.versionNumber,
+                'platform': self.platform,
+                'content': self.folderName,
+                'screen': [self.screen.width(), self.screen.height()],
+                'numLevels': self.numLevels,
+                'numTotalImages': self.numTotalImages,
+                'levelToUnlock': self.levelToUnlock,
+                'timeLimitMultiplier': self.timeLimitMultiplier,
+                'upgradeTrigger': self.upgradeTrigger,
+                'upgradeMode': self.upgradeMode,
+                'minPowerToMove': self.minPowerToMove,
+                'maxPowerToMove': self.maxPowerToMove}
+
+    def endSession(self):
+        if self.recorder is not None:
+            self.recorder.endSession()
 
-        else:
-            raise ValueError('upgradeMode in config.ini does not match any accepted value')
+    def findPorts(self):
+        # called from the port monitor thread
+        return findBaseStationPorts()
 
-        iLP = int(leftPower)
-        iRP = int(rightPower)
+    def setPower(self, powerLevel):
+        iLP, iRP = motorPowers(powerLevel, self.upgradeMode, int(self.minPowerToMove), int(self.maxPowerToMove))
 
         # desiredPowerLevel -= 45
-        if self.robot:
-            print('connected to BaseStation, attempting to set power to', powerLevel, '   L:', leftPower, 'R:', rightPower)
-            for baseStation in self.robot:
-                baseStation.write(bytes([0, 0, iLP, iRP])+b'\n')
-                baseStation.write(bytes([0, 0, iLP, iRP])+b'\n')
+        # kept for base stations that are plugged in later
+        self.lastPowerCommand = powerCommand(iLP, iRP)
+        if self.raceClient is not None:
+            self.raceClient.sendProgress(powerLevel, self.currentLevel, self.currentImageNumber, self.currentTotalImageNumber, self.numTotalImages)
+        elif self.robot:
+            log.debug('connected to BaseStation, attempting to set power to %s   L: %s R: %s', powerLevel, iLP, iRP)
+            # queued to the writer threads, which send the latest command to every station in parallel
+            for writer in self.robotWriters:
+                writer.send(self.lastPowerCommand)
         else:
-            print('BaseStation not connected, cannot change power level')
-
-    def interpolate(self, inputValue, inputMin, inputMax, outputMin, outputMax):
-        ratio = (inputValue - inputMin)/(inputMax - inputMin)
-        outputValue = (outputMax - outputMin) * ratio + outputMin
-        return outputValue
+            log.debug('BaseStation not connected, cannot change power level')
 
     def closeEvent(self, event):
-        print('emitting cleanup event')
+        log.info('emitting cleanup event')
         try:
             self.settingsWindow.Abort()
         except:
-            print('ERROR - Could not properly close settings window!')
+            log.warning('Could not properly close settings window!')
         self.cleanupEvent.emit()
 
     def cleanupStuff(self):
-        if self.robot:
-            for baseStation in self.robot:
-                baseStation.close()
-        print('closing')
+        self.exportProfile()
+        self.endSession()
+        self.prefetcher.stop()
+        self.contentWatcher.stop()
+        self.stopRobotWriters()
+        if self.raceClient is not None:
+            self.raceClient.stop()
+        # the seat's base stations go back to the shared resources, which close them with the last seat
+        self.shared.removeSeat(self)
+        self.robot = []
 
     def createReferenceFile(self):
         referenceFolder = QFileDialog.getExistingDirectory(self, "Select Folder Location for Reference")
-        self.startTime = time.time()
-        if os.path.isdir(referenceFolder):
-
-            if(self.numLevels > 0):
-                # multiLevel game selected
-                print('multiLevelGame Reference started')
-                for i in range(0, self.numLevels):
-                    # create folder to hold level in reference file
-                    levelFolderName = referenceFolder+os.path.sep+self.folderListNameOnly[i]
-                    os.mkdir(levelFolderName)
-
-                    self.loadLevel(self.folderList[i])
-
-                    # start msmd level
-                    self.stackedLayout.setCurrentIndex(1)
-                    self.showMaximized()
-                    time.sleep(0.2)
-
-                    for j in range(0, self.numImages):
-                        print('next image: '+str(j))
-                        self.paintImageIndex(j)
-                        QApplication.processEvents()
-
-                        time.sleep(0.05)
-                        imageName = str(self.currentImageNumber).zfill(6)
-                        pyautogui.screenshot(levelFolderName+os.path.sep+imageName+'.png')
-
-                        self.currentImageNumber += 1
-                        self.currentTotalImageNumber += 1
-
-                    self.currentImageNumber = 0
-            else:
-                print('singleLevelGame Reference Started')
-                self.loadLevel(self.folderName)
-                self.stackedLayout.setCurrentIndex(1)
-                self.showMaximized()
-
-                for j in range(0, self.numImages):
-                    print('next image: '+str(j))
-                    self.paintImageIndex(j)
-                    QApplication.processEvents()
-
-                    time.sleep(0.05)
-                    imageName = str(self.currentImageNumber).zfill(6)
-                    pyautogui.screenshot(levelFolderName+os.path.sep+imageName+'.png')
-
-                    self.currentImageNumber += 1
-                    self.currentTotalImageNumber += 1
-
-                self.currentImageNumber = 0
+        if not os.path.isdir(referenceFolder):
+            return
+        startTime = time.perf_counter()
+        if(self.numLevels > 0):
+            # multiLevel game selected: one folder per level in the reference folder
+            log.info('multiLevelGame Reference started')
+            levels = [(self.folderList[i], os.path.join(referenceFolder, self.folderListNameOnly[i])) for i in range(self.numLevels)]
+        else:
+            log.info('singleLevelGame Reference Started')
+            levels = [(self.folderName, referenceFolder)]
 
-            self.gameCompleted()
+        # the frames are rendered offscreen, the game window is not shown
+        renderer = ReferenceRenderer(self.screen.size(), self.hotSpotSize)
+        numFrames = 0
+        try:
+            for levelFolder, outputFolder in levels:
+                if(self.loadLevel(levelFolder) < 0):
+                    return
+                try:
+                    numFrames += renderer.renderLevel(self.hotSpotTable, self.imageList, outputFolder)
+                except ValueError as error:
+                    QMessageBox.critical(self, 'Error: images reading', 'Images of "'+levelFolder+'" could not be read ('+str(error)+')', QMessageBox.Ok)
+                    return
+                log.info('reference of %s rendered', levelFolder)
+        finally:
+            failed = renderer.finish()
+        log.info('%s reference images written in %.2f s', numFrames-len(failed), time.perf_counter()-startTime)
+        if failed:
+            QMessageBox.critical(self, 'Error: Reference', str(len(failed))+' reference images could not be written to "'+referenceFolder+'"', QMessageBox.Ok)
+        else:
+            QMessageBox.information(self, 'Reference Created', str(numFrames)+' reference images were written to "'+referenceFolder+'"', QMessageBox.Ok)
 
 
 if __name__ == '__main__':
@@ -876,5 +1056,8 @@ if __name__ == '__main__':
     appResources['imgRefresh'] = appctxt.get_resource('refresh.png')
     appResources['imgSettings'] = appctxt.get_resource('settings.png')
     ex = App(appResources)
+    # multi-seat mode: one more game window per seat, sharing the first one's resources;
+    # the first window keeps a reference to them, since windows without a parent are deleted with their last one
+    ex.extraSeats = [App(appResources, shared=ex.shared, seatNumber=seatNumber) for seatNumber in range(1, ex.numSeats)]
     exit_code = appctxt.app.exec_()
     sys.exit(exit_code)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Command line tool that converts a content folder into a single .msmdpack file.
+
+usage: python PackContent.py CONTENT_FOLDER [-o OUTPUT_FILE]
+
+The content folder is validated the same way the game validates it, then
+every level's hotspots.json, png images and soundN.wav files are written into
+one ContentPack file (see ContentPack.py for the layout).
+"""
+
+import os
+import sys
+import json
+import argparse
+from ContentPack import PACK_EXTENSION, PACK_MAGIC, PACK_VERSION, HEADER
+from ContentValidator import validateContent, SOUND_FILE_PATTERN
+
+
+def packContent(folderName, packFileName, hotSpotFilename='hotspots.json'):
+    levelInfoList = validateContent(folderName, hotSpotFilename)
+    for levelInfo in levelInfoList:
+        if levelInfo.error:
+            raise ValueError('level "%s" is not valid (%s)' % (levelInfo.folder, levelInfo.error))
+    singleLevel = levelInfoList[0].folder == folderName
+
+    # lay out the blobs first so the index can be written before them
+    index = {'levels': []}
+    blobFiles = []
+    offset = 0
+    for levelInfo in levelInfoList:
+        with open(os.path.join(levelInfo.folder, hotSpotFilename), 'r') as hotSpotFile:
+            hotSpots = json.load(hotSpotFile)
+        level = {'name': '' if singleLevel else levelInfo.name,
+                 'hotspots': hotSpots,
+                 'images': [],
+                 'sounds': {}}
+        for imageFile, (width, height) in zip(levelInfo.imageFiles, levelInfo.imageSizes):
+            fileName = os.path.join(levelInfo.folder, imageFile)
+            length = os.path.getsize(fileName)
+            level['images'].append([offset, length, width, height])
+            blobFiles.append(fileName)
+            offset += length
+        for soundFile in sorted(os.listdir(levelInfo.folder)):
+            match = SOUND_FILE_PATTERN.match(soundFile)
+            if match:
+                fileName = os.path.join(levelInfo.folder, soundFile)
+                length = os.path.getsize(fileName)
+                level['sounds'][str(int(match.group(1)))] = [offset, length]
+                blobFiles.append(fileName)
+                offset += length
+        index['levels'].append(level)
+
+    indexData = json.dumps(index, separators=(',', ':')).encode('utf-8')
+    with open(packFileName, 'wb') as packFile:
+        packFile.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, len(indexData)))
+        packFile.write(indexData)
+        for fileName in blobFiles:
+            with open(fileName, 'rb') as blobFile:
+                packFile.write(blobFile.read())
+    return levelInfoList
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert an MSMD content folder into a single %s file' % PACK_EXTENSION)
+    parser.add_argument('folder', help='content folder (a single level or a folder of level folders)')
+    parser.add_argument('-o', '--output', help='pack file to create (default: <folder>%s)' % PACK_EXTENSION)
+    args = parser.parse_args(argv)
+
+    folderName = os.path.normpath(args.folder)
+    if not os.path.isdir(folderName):
+        parser.error('%s is not a folder' % folderName)
+    packFileName = args.output or folderName+PACK_EXTENSION
+    try:
+        levelInfoList = packContent(folderName, packFileName)
+    except ValueError as error:
+        print('ERROR - %s' % error)
+        return 1
+    print('packed %s levels (%s images) into %s' % (
+        len(levelInfoList), sum(levelInfo.numImages for levelInfo in levelInfoList), packFileName))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
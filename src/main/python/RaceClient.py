@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Connection of a game to the race server (see RaceServer.py).
+
+With race_server set in config.ini the game does not open any base station
+itself: its power levels are sent to the server together with its progress,
+and the server drives the base stations of the whole class. The connection
+is made again when it is lost; meanwhile only the latest progress is kept,
+and it is sent as soon as the game is connected again.
+"""
+
+import json
+import logging
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtNetwork import QAbstractSocket, QLocalSocket, QTcpSocket
+from RaceServer import isUnixAddress, splitAddress
+
+
+log = logging.getLogger('msmd.race')
+
+
+class RaceClient(QObject):
+    stationChanged = pyqtSignal(str)
+
+    def __init__(self, address, name, station=None, reconnectInterval=2.0, parent=None):
+        super().__init__(parent)
+        self.address = address
+        self.name = name
+        self.station = station or None
+        self.assignedStation = None
+        self.seq = 0
+        self.pending = None  # latest progress that was not sent yet
+        self.buffer = b''
+        self.isLocal = isUnixAddress(address)
+        if self.isLocal:
+            self.socket = QLocalSocket(self)
+        else:
+            self.socket = QTcpSocket(self)
+            self.socket.setSocketOption(QAbstractSocket.LowDelayOption, 1)
+            self.host, self.port = splitAddress(address)
+        self.socket.connected.connect(self.connectedHandler)
+        self.socket.disconnected.connect(self.disconnectedHandler)
+        self.socket.readyRead.connect(self.readHandler)
+        self.reconnectTimer = QTimer(self)
+        self.reconnectTimer.setInterval(int(reconnectInterval*1000))
+        self.reconnectTimer.timeout.connect(self.connectToServer)
+
+    def start(self):
+        self.connectToServer()
+        self.reconnectTimer.start()
+
+    def stop(self):
+        self.reconnectTimer.stop()
+        if self.isLocal:
+            self.socket.disconnectFromServer()
+        else:
+            self.socket.disconnectFromHost()
+
+    def isConnected(self):
+        if self.isLocal:
+            return self.socket.state() == QLocalSocket.ConnectedState
+        return self.socket.state() == QAbstractSocket.ConnectedState
+
+    def connectToServer(self):
+        if self.isLocal:
+            if self.socket.state() == QLocalSocket.UnconnectedState:
+                self.socket.connectToServer(self.address)
+        elif self.socket.state() == QAbstractSocket.UnconnectedState:
+            self.socket.connectToHost(self.host, self.port)
+
+    def connectedHandler(self):
+        log.info('connected to race server %s', self.address)
+        self.buffer = b''
+        self.write({'type': 'hello', 'name': self.name, 'station': self.station})
+        if self.pending is not None:
+            self.write(self.pending)
+            self.pending = None
+
+    def disconnectedHandler(self):
+        log.warning('disconnected from race server %s', self.address)
+        if self.assignedStation is not None:
+            self.assignedStation = None
+            self.stationChanged.emit('')
+
+    def write(self, message):
+        self.socket.write(json.dumps(message, separators=(',', ':')).encode('utf-8')+b'\n')
+        self.socket.flush()
+
+    def sendProgress(self, powerLevel, level, step, totalStep, totalSteps):
+        self.seq += 1
+        message = {'type': 'progress', 'seq': self.seq, 'power': powerLevel, 'level': level,
+                   'step': step, 'totalStep': totalStep, 'totalSteps': totalSteps}
+        if self.isConnected():
+            self.write(message)
+        else:
+            self.pending = message
+
+    def readHandler(self):
+        self.buffer += bytes(self.socket.readAll())
+        lines = self.buffer.split(b'\n')
+        self.buffer = lines.pop()
+        for line in lines:
+            try:
+                message = json.loads(line.decode('utf-8'))
+            except ValueError:
+                log.warning('invalid message from race server: %r', line)
+                continue
+            if message.get('type') == 'ack':
+                station = message.get('station')
+                if station != self.assignedStation:
+                    self.assignedStation = station
+                    log.info('racing with base station %s', station)
+                    self.stationChanged.emit(station or '')
+            elif message.get('type') == 'error':
+                log.error('race server: %s', message.get('message'))
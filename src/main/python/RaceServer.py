@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+Race server: one process that owns every base station of a classroom race.
+
+usage: python RaceServer.py serve [--listen ADDRESS ...] [--config FILE]
+                                  [--ports PORT,PORT] [--batch-interval S]
+       python RaceServer.py standins ADDRESS [--clients N] [--steps N]
+                                     [--interval S]
+       python RaceServer.py standings ADDRESS
+
+An address is HOST:PORT for local tcp or the path of a unix socket.
+
+The games (see RaceClient.py, enabled with race_server in config.ini) do not
+open any serial port. They connect to the server and report their progress
+as json lines; the server turns the reported power levels into power
+commands with the upgrade mode of its config.ini (see motorPowers) and sends
+them through the base station writers. Progress that arrives within one
+batch interval is sent as one batch, and every station only gets the latest
+command of its racer. Each racer is given one base station: the one it asks
+for, or the first free one.
+
+Messages from a client:
+    {"type": "hello", "name": NAME, "station": PORT or null}
+    {"type": "progress", "seq": N, "power": 0-100, "level": L, "step": S,
+     "totalStep": T, "totalSteps": TT}
+    {"type": "standings"}
+Messages to a client:
+    {"type": "ack", "seq": N, "station": PORT or null}   (the command was queued)
+    {"type": "standings", "racers": [...]}
+    {"type": "error", "message": TEXT}
+
+The standins command connects any number of stand-in clients that play
+through a number of steps and reports the progress-to-ack latency, so the
+server can be tested without any game or hardware (see also
+BaseStationSimulator.py).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import configparser
+from BaseStation import BaseStationWriter, findBaseStationPorts, openBaseStation, powerCommand, motorPowers, UPGRADE_MODES
+
+
+log = logging.getLogger('msmd.race')
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+
+def isUnixAddress(address):
+    return os.sep in address or ':' not in address
+
+
+def splitAddress(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def encodeMessage(message):
+    return json.dumps(message, separators=(',', ':')).encode('utf-8')+b'\n'
+
+
+class Racer(object):
+
+    def __init__(self, writer, joinOrder):
+        self.writer = writer
+        self.joinOrder = joinOrder
+        self.name = 'racer %s' % joinOrder
+        self.requestedStation = None
+        self.station = None
+        self.power = None
+        self.seq = 0
+        self.level = 0
+        self.step = 0
+        self.totalStep = 0
+        self.totalSteps = 0
+
+    def send(self, message):
+        # buffered by the transport; a client that stopped reading only fills its own buffer
+        if not self.writer.transport.is_closing():
+            self.writer.write(encodeMessage(message))
+
+    def standing(self):
+        return {'name': self.name,
+                'station': self.station,
+                'level': self.level,
+                'step': self.step,
+                'totalStep': self.totalStep,
+                'totalSteps': self.totalSteps,
+                'power': self.power}
+
+
+class RaceServer(object):
+
+    def __init__(self, upgradeMode, minPower, maxPower, findPorts=findBaseStationPorts, openPort=openBaseStation,
+                 scanInterval=2.0, batchInterval=0.02, loop=None):
+        if upgradeMode not in UPGRADE_MODES:
+            raise ValueError('upgradeMode %s does not match any accepted value' % upgradeMode)
+        self.upgradeMode = upgradeMode
+        self.minPower = minPower
+        self.maxPower = maxPower
+        self.findPorts = findPorts
+        self.openPort = openPort
+        self.scanInterval = scanInterval
+        self.batchInterval = batchInterval
+        self.loop = loop or asyncio.get_event_loop()
+        self.racers = []
+        self.joined = 0
+        self.writers = {}  # port -> BaseStationWriter
+        self.changed = set()  # racers with progress that was not sent yet
+        self.wakeUp = asyncio.Event()
+        self.servers = []
+        self.tasks = []
+        self.batches = 0
+
+    async def start(self, addresses):
+        for address in addresses:
+            if isUnixAddress(address):
+                server = await asyncio.start_unix_server(self.handleClient, address)
+            else:
+                host, port = splitAddress(address)
+                server = await asyncio.start_server(self.handleClient, host, port)
+            self.servers.append(server)
+            log.info('race server listening on %s', address)
+        self.tasks = [self.loop.create_task(self.scanPorts()), self.loop.create_task(self.sendBatches())]
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        for racer in self.racers:
+            racer.writer.close()
+        for port in list(self.writers):
+            self.stationDetached(port)
+
+    # base stations
+
+    async def scanPorts(self):
+        while True:
+            try:
+                ports = set(await self.loop.run_in_executor(None, self.findPorts))
+            except Exception as error:
+                log.error('could not list serial ports: %s', error)
+                ports = set(self.writers)
+            for port in sorted(set(self.writers)-ports):
+                self.stationDetached(port)
+            for port in sorted(ports-set(self.writers)):
+                try:
+                    baseStation = await self.loop.run_in_executor(None, self.openPort, port)
+                except OSError as error:  # serial.SerialException is an OSError
+                    log.warning('could not open base station %s: %s', port, error)
+                    continue
+                self.stationAttached(port, baseStation)
+            await asyncio.sleep(self.scanInterval)
+
+    def stationAttached(self, port, baseStation):
+        log.info('base station attached: %s', port)
+        self.writers[port] = BaseStationWriter(baseStation)
+        self.assignStations()
+
+    def stationDetached(self, port):
+        log.info('base station detached: %s', port)
+        writer = self.writers.pop(port)
+        writer.stop()
+        writer.baseStation.close()
+        for racer in self.racers:
+            if racer.station == port:
+                racer.station = None
+        self.assignStations()
+
+    def assignStations(self):
+        # racers that asked for a station get it first, the others get the free ones in join order
+        taken = set(racer.station for racer in self.racers if racer.station is not None)
+        for racer in sorted(self.racers, key=lambda racer: (racer.requestedStation is None, racer.joinOrder)):
+            if racer.station is not None:
+                continue
+            if racer.requestedStation is not None:
+                station = racer.requestedStation if racer.requestedStation in self.writers and racer.requestedStation not in taken else None
+            else:
+                station = next((port for port in sorted(self.writers) if port not in taken), None)
+            if station is not None:
+                racer.station = station
+                taken.add(station)
+                log.info('%s races with base station %s', racer.name, station)
+                if racer.power is not None:
+                    self.changed.add(racer)
+                    self.wakeUp.set()
+
+    # clients
+
+    async def handleClient(self, reader, writer):
+        self.joined += 1
+        racer = Racer(writer, self.joined)
+        self.racers.append(racer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line.decode('utf-8'))
+                    self.handleMessage(racer, message)
+                except (ValueError, KeyError, TypeError) as error:
+                    racer.send({'type': 'error', 'message': str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.racers.remove(racer)
+            self.changed.discard(racer)
+            writer.close()
+            log.info('%s left the race', racer.name)
+            if racer.station is not None:
+                self.assignStations()
+
+    def handleMessage(self, racer, message):
+        messageType = message['type']
+        if messageType == 'progress':
+            power = float(message['power'])
+            if power < 0 or power > 100:
+                raise ValueError('power has to be between 0 and 100')
+            racer.power = power
+            racer.seq = int(message.get('seq', racer.seq+1))
+            racer.level = int(message.get('level', racer.level))
+            racer.step = int(message.get('step', racer.step))
+            racer.totalStep = int(message.get('totalStep', racer.totalStep))
+            racer.totalSteps = int(message.get('totalSteps', racer.totalSteps))
+            self.changed.add(racer)
+            self.wakeUp.set()
+        elif messageType == 'hello':
+            racer.name = str(message.get('name') or racer.name)
+            racer.requestedStation = message.get('station') or None
+            log.info('%s joined the race', racer.name)
+            self.assignStations()
+        elif messageType == 'standings':
+            racer.send({'type': 'standings', 'racers': self.standings()})
+        else:
+            raise ValueError('unknown message type %s' % messageType)
+
+    def standings(self):
+        racers = sorted(self.racers, key=lambda racer: (-racer.totalStep, racer.joinOrder))
+        return [racer.standing() for racer in racers]
+
+    async def sendBatches(self):
+        # progress arriving while a batch is sent waits for the next one, at most batchInterval later
+        while True:
+            await self.wakeUp.wait()
+            self.wakeUp.clear()
+            changed = self.changed
+            self.changed = set()
+            for racer in changed:
+                if racer.station is not None:
+                    command = powerCommand(*motorPowers(racer.power, self.upgradeMode, self.minPower, self.maxPower))
+                    self.writers[racer.station].send(command)
+                racer.send({'type': 'ack', 'seq': racer.seq, 'station': racer.station})
+            self.batches += 1
+            await asyncio.sleep(self.batchInterval)
+
+    def stats(self):
+        return {'racers': len(self.racers),
+                'batches': self.batches,
+                'stations': [writer.stats() for writer in self.writers.values()]}
+
+
+# stand-in clients
+
+async def openConnection(address):
+    if isUnixAddress(address):
+        return await asyncio.open_unix_connection(address)
+    host, port = splitAddress(address)
+    return await asyncio.open_connection(host, port)
+
+
+async def standIn(address, name, numSteps, interval, latencies, loop):
+    # plays through numSteps steps, one every interval seconds, and measures the progress-to-ack time
+    reader, writer = await openConnection(address)
+    writer.write(encodeMessage({'type': 'hello', 'name': name}))
+    sentAt = {}
+
+    async def readAcks():
+        while len(latencies[name]) < numSteps:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line.decode('utf-8'))
+            if message['type'] == 'ack':
+                # progress the server replaced with a newer one before sending is acked with it
+                now = time.perf_counter()
+                for seq in sorted(seq for seq in sentAt if seq <= message['seq']):
+                    latencies[name].append(now-sentAt.pop(seq))
+    latencies[name] = []
+    acks = loop.create_task(readAcks())
+    for step in range(numSteps):
+        sentAt[step+1] = time.perf_counter()
+        writer.write(encodeMessage({'type': 'progress', 'seq': step+1, 'power': 100*step/max(1, numSteps-1),
+                                    'level': 0, 'step': step, 'totalStep': step, 'totalSteps': numSteps}))
+        await asyncio.sleep(interval)
+    try:
+        await asyncio.wait_for(acks, 5)
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+
+
+async def requestStandings(address):
+    reader, writer = await openConnection(address)
+    writer.write(encodeMessage({'type': 'standings'}))
+    line = await reader.readline()
+    writer.close()
+    return json.loads(line.decode('utf-8'))
+
+
+def readRobotSettings(configFileName):
+    config = configparser.ConfigParser()
+    if not config.read(configFileName):
+        raise IOError('%s was not found' % configFileName)
+    robotSettings = config['robot']
+    return robotSettings['upgradeMode'], int(robotSettings['minPowerToMove']), int(robotSettings['maxPowerToMove']), \
+        float(robotSettings.get('port_scan_interval', '2'))
+
+
+def serve(args, loop):
+    upgradeMode, minPower, maxPower, scanInterval = readRobotSettings(args.config)
+    findPorts = findBaseStationPorts
+    if args.ports:
+        ports = [port.strip() for port in args.ports.split(',') if port.strip()]
+        findPorts = lambda: ports
+    server = RaceServer(upgradeMode, minPower, maxPower, findPorts, scanInterval=scanInterval,
+                        batchInterval=args.batch_interval)
+    loop.run_until_complete(server.start(args.listen or [DEFAULT_ADDRESS]))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.info('race server stats: %s', server.stats())
+        loop.run_until_complete(server.stop())
+    return 0
+
+
+def runStandIns(args, loop):
+    latencies = {}
+    start = time.perf_counter()
+    loop.run_until_complete(asyncio.gather(*[standIn(args.address, 'stand-in %s' % (client+1), args.steps, args.interval, latencies, loop)
+                                             for client in range(args.clients)]))
+    allLatencies = sorted(latency for clientLatencies in latencies.values() for latency in clientLatencies)
+    result = {'clients': args.clients,
+              'steps': args.steps,
+              'acked': len(allLatencies),
+              'duration': time.perf_counter()-start}
+    if allLatencies:
+        result.update({'meanLatency': sum(allLatencies)/len(allLatencies),
+                       'p50Latency': allLatencies[len(allLatencies)//2],
+                       'p95Latency': allLatencies[min(len(allLatencies)-1, int(0.95*len(allLatencies)))],
+                       'maxLatency': allLatencies[-1]})
+    json.dump(result, sys.stdout, indent=1)
+    print()
+    return 0 if len(allLatencies) == args.clients*args.steps else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MSMD race server')
+    commands = parser.add_subparsers(dest='command')
+    serveParser = commands.add_parser('serve', help='run the race server')
+    serveParser.add_argument('--listen', action='append', help='HOST:PORT or unix socket path (default: %s, can be given more than once)' % DEFAULT_ADDRESS)
+    serveParser.add_argument('--config', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'resources', 'base', 'config.ini'),
+                             help='config.ini with the [robot] settings')
+    serveParser.add_argument('--ports', help='comma separated serial ports to use instead of finding the base stations')
+    serveParser.add_argument('--batch-interval', type=float, default=0.02, help='seconds between power command batches')
+    standInParser = commands.add_parser('standins', help='connect stand-in clients and measure the latency')
+    standInParser.add_argument('address', nargs='?', default=DEFAULT_ADDRESS)
+    standInParser.add_argument('--clients', type=int, default=30)
+    standInParser.add_argument('--steps', type=int, default=100)
+    standInParser.add_argument('--interval', type=float, default=0.05, help='seconds between the steps of a client')
+    standingsParser = commands.add_parser('standings', help='print the current standings')
+    standingsParser.add_argument('address', nargs='?', default=DEFAULT_ADDRESS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+    loop = asyncio.get_event_loop()
+    try:
+        if args.command == 'serve':
+            return serve(args, loop)
+        if args.command == 'standins':
+            return runStandIns(args, loop)
+        if args.command == 'standings':
+            json.dump(loop.run_until_complete(requestStandings(args.address)), sys.stdout, indent=1)
+            print()
+            return 0
+        parser.print_help()
+        return 2
+    finally:
+        loop.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Command line tool that renders the reference frames of many content folders
+and content packs without showing any window.
+
+usage: python ReferenceBuilder.py CONTENT [CONTENT ...] -o OUTPUT_FOLDER
+                                  [--jobs N] [--width W] [--height H]
+                                  [--hotspot-size S] [--force]
+
+Every CONTENT (a content folder or a .msmdpack file) gets a reference folder
+OUTPUT_FOLDER/<name> laid out like the ones made by the Create Reference
+button: one folder per level, or the frames themselves for a single level
+game. The contents are rendered in parallel by a pool of worker processes,
+each running Qt's offscreen platform.
+
+Builds are resumable: a reference folder is only replaced once all of its
+frames were written, and it records the stat of every file it was made from
+together with the render settings. Contents whose reference is up to date
+are skipped, so an interrupted run can simply be started again.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QSize
+from PyQt5.QtWidgets import QApplication
+from ContentPack import ContentPack, PACK_EXTENSION, isContentPack
+from ContentValidator import validateContent, findLevelFolders
+from HotSpotTable import HotSpotTable
+from ImageStore import EncodedImageList
+from ReferenceRenderer import ReferenceRenderer, RENDER_VERSION
+
+
+STAMP_FILENAME = 'reference.json'
+HOTSPOT_FILENAME = 'hotspots.json'
+
+# the QApplication of a worker process
+_application = None
+
+
+def referenceName(content):
+    name = os.path.basename(os.path.normpath(content))
+    if name.lower().endswith(PACK_EXTENSION):
+        name = name[:-len(PACK_EXTENSION)]
+    return name
+
+
+def fileSourceKey(fileName):
+    # a source file is identified by its path, size and modification time
+    fileStat = os.stat(fileName)
+    return '%s|%s|%s' % (os.path.abspath(fileName), fileStat.st_size, fileStat.st_mtime_ns)
+
+
+def contentFingerprint(content):
+    # stat only: changes when any hotspot file or image of the content is replaced
+    if isContentPack(content):
+        keys = [fileSourceKey(content)]
+    else:
+        keys = []
+        for levelFolder in findLevelFolders(content) or [content]:
+            for fileName in sorted(os.listdir(levelFolder)):
+                if fileName == HOTSPOT_FILENAME or fileName.endswith('.png'):
+                    keys.append(fileSourceKey(os.path.join(levelFolder, fileName)))
+    return hashlib.sha1('\n'.join(keys).encode('utf-8')).hexdigest()
+
+
+def makeStamp(content, args):
+    return {'renderVersion': RENDER_VERSION,
+            'size': [args.width, args.height],
+            'hotSpotSize': args.hotspot_size,
+            'content': os.path.abspath(content),
+            'fingerprint': contentFingerprint(content)}
+
+
+def isUpToDate(outputFolder, stamp):
+    try:
+        with open(os.path.join(outputFolder, STAMP_FILENAME), 'r') as stampFile:
+            return json.load(stampFile) == stamp
+    except (IOError, ValueError):
+        return False
+
+
+def folderLevels(content):
+    # yields (hotspot table, images, level name) per level; the name is '' for a single level game
+    levelInfoList = validateContent(content, HOTSPOT_FILENAME, maxWorkers=1)
+    singleLevel = levelInfoList[0].folder == content
+    for levelInfo in levelInfoList:
+        if levelInfo.error:
+            raise ValueError('level "%s" is not valid (%s)' % (levelInfo.folder, levelInfo.error))
+        with open(os.path.join(levelInfo.folder, HOTSPOT_FILENAME), 'r') as hotSpotFile:
+            hotSpotTable = HotSpotTable(json.load(hotSpotFile))
+        images = EncodedImageList.fromFiles([os.path.join(levelInfo.folder, imageFile) for imageFile in levelInfo.imageFiles])
+        yield hotSpotTable, images, '' if singleLevel else levelInfo.name
+
+
+def packLevels(content):
+    contentPack = ContentPack(content)
+    try:
+        for levelInfo in validateContent(content, contentPack=contentPack):
+            if levelInfo.error:
+                raise ValueError('level "%s" is not valid (%s)' % (levelInfo.folder, levelInfo.error))
+            hotSpotTable = HotSpotTable(contentPack.hotSpots(levelInfo.folder))
+            images = EncodedImageList([contentPack.imageData(levelInfo.folder, imageIndex)
+                                       for imageIndex in range(contentPack.numImageBlobs(levelInfo.folder))])
+            yield hotSpotTable, images, '' if contentPack.isSingleLevel() else levelInfo.name
+    finally:
+        contentPack.close()
+
+
+def initWorker():
+    global _application
+    _application = QApplication(sys.argv[:1])
+
+
+def buildReference(task):
+    # runs in a worker process; returns (content, number of frames, seconds, error)
+    content, outputFolder, stamp, size, hotSpotSize, encoders = task
+    start = time.perf_counter()
+    partialFolder = outputFolder+'.partial'
+    shutil.rmtree(partialFolder, ignore_errors=True)
+    renderer = ReferenceRenderer(QSize(*size), hotSpotSize, encoders)
+    numFrames = 0
+    error = None
+    try:
+        levels = packLevels(content) if isContentPack(content) else folderLevels(content)
+        for hotSpotTable, images, levelName in levels:
+            numFrames += renderer.renderLevel(hotSpotTable, images, os.path.join(partialFolder, levelName))
+    except Exception as levelError:
+        # a broken content is reported as failed, the other contents are still built
+        error = '%s: %s' % (type(levelError).__name__, levelError)
+    finally:
+        failed = renderer.finish()
+    if failed and error is None:
+        error = '%s frames could not be written' % len(failed)
+    if error is None:
+        # the finished reference replaces the old one, then gets its stamp
+        try:
+            with open(os.path.join(partialFolder, STAMP_FILENAME), 'w') as stampFile:
+                json.dump(stamp, stampFile, indent=1)
+            shutil.rmtree(outputFolder, ignore_errors=True)
+            os.replace(partialFolder, outputFolder)
+        except OSError as writeError:
+            error = str(writeError)
+    if error is not None:
+        shutil.rmtree(partialFolder, ignore_errors=True)
+        return content, 0, time.perf_counter()-start, error
+    return content, numFrames, time.perf_counter()-start, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the reference frames of MSMD content folders and packs')
+    parser.add_argument('content', nargs='+', help='content folders and %s files' % PACK_EXTENSION)
+    parser.add_argument('-o', '--output', required=True, help='folder to write the reference folders to')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='number of worker processes (default: number of cpus)')
+    parser.add_argument('--width', type=int, default=1920, help='width of the rendered game screen')
+    parser.add_argument('--height', type=int, default=1080, help='height of the rendered game screen')
+    parser.add_argument('--hotspot-size', type=int, default=50, help='hotspot diameter in recorded screen pixels')
+    parser.add_argument('--force', action='store_true', help='render references that are up to date too')
+    args = parser.parse_args(argv)
+
+    names = {}
+    tasks = []
+    numSkipped = 0
+    for content in args.content:
+        content = os.path.normpath(content)
+        if not (os.path.isdir(content) or isContentPack(content)):
+            parser.error('%s is not a content folder or %s file' % (content, PACK_EXTENSION))
+        name = referenceName(content)
+        if name in names:
+            parser.error('%s and %s would both be written to %s' % (names[name], content, name))
+        names[name] = content
+        outputFolder = os.path.join(args.output, name)
+        stamp = makeStamp(content, args)
+        if not args.force and isUpToDate(outputFolder, stamp):
+            numSkipped += 1
+            continue
+        tasks.append((content, outputFolder, stamp, (args.width, args.height), args.hotspot_size, 0))
+    print('%s of %s references are up to date' % (numSkipped, len(args.content)), file=sys.stderr)
+    if not tasks:
+        return 0
+
+    os.makedirs(args.output, exist_ok=True)
+    numJobs = max(1, min(args.jobs, len(tasks)))
+    # cores not needed for a job of their own help encoding the frames
+    encoders = max(1, (os.cpu_count() or 1)//numJobs)
+    tasks = [task[:-1]+(encoders,) for task in tasks]
+    numFailed = 0
+    numFrames = 0
+    start = time.perf_counter()
+    with multiprocessing.Pool(numJobs, initializer=initWorker) as pool:
+        for done, (content, frames, seconds, error) in enumerate(pool.imap_unordered(buildReference, tasks), 1):
+            if error:
+                numFailed += 1
+                print('[%s/%s] %s: ERROR - %s' % (done, len(tasks), content, error), file=sys.stderr)
+            else:
+                numFrames += frames
+                print('[%s/%s] %s: %s frames in %.1f s' % (done, len(tasks), content, frames, seconds), file=sys.stderr)
+    print('rendered %s frames of %s contents in %.1f s (%s failed, %s skipped)' % (
+        numFrames, len(tasks)-numFailed, time.perf_counter()-start, numFailed, numSkipped))
+    return 1 if numFailed else 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Offscreen rendering of reference frames.
+
+Every step of a level is set up in a GameScene of its own (never shown) and
+rendered straight into a QImage, with the step's instructions drawn above
+the scene. The PNG encoding of the frames, which takes much longer than the
+rendering, is done on a pool of worker threads while the next frames are
+rendered. The number of frames waiting to be encoded is bounded so a large
+pack does not have to fit in memory.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtGui import QPixmap
+from GameScene import GameScene
+from HotSpotTable import STEP_MOUSE
+from ImagePrefetcher import prepareImage
+
+
+log = logging.getLogger('msmd.reference')
+
+# part of the up-to-date check of ReferenceBuilder; increase it whenever the
+# frames would be drawn differently (hotspot overlay, caption, layout)
+RENDER_VERSION = 3
+
+
+def referenceFileName(outputFolder, step):
+    return os.path.join(outputFolder, str(step).zfill(6)+'.png')
+
+
+class ReferenceRenderer(object):
+
+    def __init__(self, size, hotSpotSize, maxWorkers=None):
+        self.size = size
+        self.hotSpotSize = hotSpotSize
+        self.scene = GameScene()
+        # the frames are the scene scaled to size, so the hotspot offset is in pixels of size
+        self.scene.setViewScale(size.height()/self.scene.sceneRect().height())
+        numWorkers = maxWorkers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=numWorkers)
+        self.pending = threading.BoundedSemaphore(2*numWorkers)
+        self.lock = threading.Lock()
+        self.failed = []
+        self.framesWritten = 0
+
+    def renderStep(self, hotSpotTable, step, image):
+        if image.isNull():
+            raise ValueError('image %s could not be decoded' % step)
+        self.scene.setBackground(QPixmap.fromImage(prepareImage(image)))
+        if hotSpotTable.types[step] == STEP_MOUSE:
+            self.scene.showHotSpot(hotSpotTable.x[step], hotSpotTable.y[step], self.hotSpotSize, hotSpotTable.buttonNames[step])
+        else:
+            self.scene.hideHotSpot()
+        return self.scene.renderFrame(self.size, hotSpotTable.commandStrings[step])
+
+    def renderLevel(self, hotSpotTable, imageList, outputFolder):
+        # renders one frame per hotspot record; returns the number of frames queued for writing
+        os.makedirs(outputFolder, exist_ok=True)
+        for step in range(len(hotSpotTable)):
+            self.save(self.renderStep(hotSpotTable, step, imageList[step]), referenceFileName(outputFolder, step))
+        self.scene.clearStep()
+        return len(hotSpotTable)
+
+    def save(self, frame, fileName):
+        # blocks while the encoders are busy with enough frames already
+        self.pending.acquire()
+        try:
+            self.executor.submit(self.writeFrame, frame, fileName)
+        except BaseException:
+            self.pending.release()
+            raise
+
+    def writeFrame(self, frame, fileName):
+        try:
+            saved = frame.save(fileName, 'PNG')
+        finally:
+            self.pending.release()
+        with self.lock:
+            if saved:
+                self.framesWritten += 1
+            else:
+                self.failed.append(fileName)
+        if not saved:
+            log.error('reference frame %s could not be written', fileName)
+
+    def finish(self):
+        # waits for the queued frames; returns the names of the frames that could not be written
+        self.executor.shutdown(wait=True)
+        return list(self.failed)
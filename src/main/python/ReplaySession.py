@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Replay of a recorded session (see SessionRecorder.py) for latency regression tests.
+
+usage: python ReplaySession.py SESSION_FILE [--content FOLDER] [--realtime]
+                               [--max-drift SECONDS] [--output FILE]
+
+The game is set up headless the way Benchmark.py does it (offscreen
+platform, fake base station, no audio output) with the settings stored in
+the session, and the recorded inputs are emitted into the game view again,
+either at their recorded times (--realtime) or as fast as possible. The game
+runs on the recorded time during the replay, so the level time limits have
+the same outcomes as in the classroom whichever mode is used. Message boxes
+are answered with Yes/Ok; choosing Cancel instead leads to the same state
+once the session continues.
+
+For every input that advanced a step, the time the game needed to handle it
+is compared with the recorded one, and a json report of the drift is
+written. With --max-drift the exit status is 1 when the 95th percentile of
+the drift is above the given number of seconds.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import configparser
+import tempfile
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import Qt, QEventLoop, QTimer
+from PyQt5.QtWidgets import QApplication
+from AudioEngine import AudioEngine
+from BaseStationSimulator import summarize
+from Benchmark import RESOURCE_FOLDER, FakeSerial, dismissDialogs, waitFor, useWorkFolder
+from MSMD_multiLevel import App
+from SessionRecorder import readSession, INPUT_MOUSE, OUTCOME_STEP, OUTCOME_LEVEL
+
+
+class ReplayClock(object):
+    # stands in for time.time in the game; set to the recorded time of the input being replayed
+
+    def __init__(self, sessionStart):
+        self.sessionStart = sessionStart
+        self.now = 0.0
+        self.handledAt = 0.0
+
+    def __call__(self):
+        return self.sessionStart+self.now
+
+
+def writeReplayConfig(folder, metadata):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(RESOURCE_FOLDER, 'config.ini'))
+    for key in ('upgradeTrigger', 'upgradeMode', 'minPowerToMove', 'maxPowerToMove'):
+        config['robot'][key] = str(metadata[key])
+    config['app']['showReferenceCreator'] = '0'
+    config['app']['level_to_unlock'] = str(metadata['levelToUnlock'])
+    config['app']['time_limit_multiplier'] = repr(metadata['timeLimitMultiplier'])
+    config['app']['record_sessions'] = '0'
+    useWorkFolder(config, folder)
+    configFileName = os.path.join(folder, 'config.ini')
+    with open(configFileName, 'w') as configFile:
+        config.write(configFile)
+    return configFileName
+
+
+def replaySession(game, metadata, records, realTime=False):
+    # returns a list of (record, seconds the replay needed, whether the game was at the recorded step)
+    clock = ReplayClock(metadata['sessionStart'])
+    game.clock = clock
+
+    def answerDialogs():
+        # the message box was closed when the recorded input had been handled
+        if game.seatDialog is not None:
+            clock.now = clock.handledAt
+        dismissDialogs()
+    dismisser = QTimer()
+    dismisser.timeout.connect(answerDialogs)
+    dismisser.start(1)
+
+    results = []
+    wallStart = time.perf_counter()
+    try:
+        game.startButtonClicked()
+        game.graphicsView.viewport().repaint()
+        for record in records:
+            if realTime:
+                while time.perf_counter()-wallStart < record.time:
+                    QApplication.processEvents(QEventLoop.AllEvents, 1)
+            clock.now = record.time
+            clock.handledAt = record.time+record.handled
+            inStep = (game.currentLevel, game.currentImageNumber) == (record.level, record.step)
+            start = time.perf_counter()
+            if record.kind == INPUT_MOUSE:
+                hotSpot = game.scene.hotSpot if record.hit else None
+                game.graphicsView.itemClickedEvent.emit(hotSpot, Qt.KeyboardModifiers(record.modifiers), Qt.MouseButton(record.button))
+            else:
+                game.graphicsView.keyPressed.emit(record.scancode, '', Qt.KeyboardModifiers(record.modifiers))
+            # level and game end dialogs do not block, they are answered by answerDialogs
+            waitFor(lambda: game.seatDialog is None)
+            results.append((record, time.perf_counter()-start, inStep))
+            game.graphicsView.viewport().repaint()
+    finally:
+        dismisser.stop()
+    return results, time.perf_counter()-wallStart
+
+
+def driftReport(metadata, records, results, replayTime, realTime):
+    steps = [(record, handled) for record, handled, inStep in results if inStep and record.outcome == OUTCOME_STEP]
+    drifts = sorted(((handled-record.handled, record, handled) for record, handled in steps), key=lambda drift: drift[0], reverse=True)
+    return {'mode': 'realtime' if realTime else 'fast',
+            'recorded': {'appVersion': metadata['appVersion'],
+                         'platform': metadata['platform'],
+                         'screen': metadata['screen'],
+                         'content': metadata['content'],
+                         'duration': records[-1].time if records else 0},
+            'inputs': len(records),
+            'replayed': len(results),
+            'outOfStep': sum(1 for _, _, inStep in results if not inStep),
+            'replayDuration': replayTime,
+            'steps': {'original': summarize([record.handled for record, _ in steps]),
+                      'replay': summarize([handled for _, handled in steps]),
+                      'drift': summarize([drift for drift, _, _ in drifts])},
+            # the recorded times of level ends include the time the message box was open
+            'levelTransitions': {'replay': summarize([handled for record, handled, _ in results if record.outcome == OUTCOME_LEVEL])},
+            'largestDrift': [{'level': record.level, 'step': record.step, 'original': record.handled, 'replay': handled, 'drift': drift}
+                             for drift, record, handled in drifts[:10]]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a recorded MSMD session and report the latency drift')
+    parser.add_argument('session', help='session file written by the game (record_sessions = 1)')
+    parser.add_argument('--content', help='content folder or pack to play (default: the recorded one)')
+    parser.add_argument('--realtime', action='store_true', help='replay the inputs at their recorded times')
+    parser.add_argument('--max-drift', type=float, help='fail when the 95th percentile of the step drift is above this many seconds')
+    parser.add_argument('--output', help='json file to write the report to (default: stdout)')
+    args = parser.parse_args(argv)
+
+    try:
+        metadata, records = readSession(args.session)
+    except (IOError, ValueError) as error:
+        print('ERROR - %s' % error)
+        return 2
+    content = args.content or metadata['content']
+    if not os.path.exists(content):
+        parser.error('content %s does not exist, use --content' % content)
+
+    application = QApplication(sys.argv[:1])
+    workFolder = tempfile.mkdtemp(prefix='msmd-replay-')
+    try:
+        resources = {'fileConfig': writeReplayConfig(workFolder, metadata),
+                     'icoMSMD': os.path.join(RESOURCE_FOLDER, 'MSMD32.png'),
+                     'imgRefresh': os.path.join(RESOURCE_FOLDER, 'refresh.png'),
+                     'imgSettings': os.path.join(RESOURCE_FOLDER, 'settings.png')}
+        game = App(resources, findPorts=lambda: ['FAKE0'], openPort=FakeSerial, audioEngine=AudioEngine(openOutput=False))
+        try:
+            game.selectContent(content)
+            waitFor(game.startButton.isEnabled)
+            if game.numTotalImages != metadata['numTotalImages']:
+                print('WARNING - the content has %s steps, the recorded one had %s' % (game.numTotalImages, metadata['numTotalImages']), file=sys.stderr)
+            results, replayTime = replaySession(game, metadata, records, args.realtime)
+            report = driftReport(metadata, records, results, replayTime, args.realtime)
+        finally:
+            game.close()
+    finally:
+        shutil.rmtree(workFolder, ignore_errors=True)
+    application.processEvents()
+
+    if args.output:
+        with open(args.output, 'w') as outputFile:
+            json.dump(report, outputFile, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+    drift = report['steps']['drift']
+    if args.max_drift is not None and drift['count'] and drift['p95'] > args.max_drift:
+        print('drift p95 %.4f s is above %.4f s' % (drift['p95'], args.max_drift), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
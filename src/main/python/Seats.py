@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Resources shared by the game windows (seats) of one process.
+
+In multi-seat mode (seats > 1 in config.ini) one process runs a game window
+per student. Each seat has its own view, progress and base station, while
+the loaded levels (hotspot tables and encoded images), the prepared images,
+the decoded sounds, the audio output and the port monitor exist only once
+and are shared read-only between the seats. A single seat game uses the
+same objects, it just has them to itself.
+
+Base stations are handed to the seats by SharedResources: with seat_ports
+set in config.ini, seat N gets the N-th listed port; otherwise a single seat
+gets every station and with several seats each seat gets one station, in
+the order they are plugged in. Stations no seat can take wait until one
+can. With race_server set no station is opened: the race server drives them
+and every seat gets its own connection to it (race_station lists the
+station of each seat).
+"""
+
+import os
+import logging
+from AppLog import setupLogging
+from AudioEngine import AudioEngine, SoundCache
+from BaseStation import PortMonitor
+from ImageCache import PreparedImageCache
+from LevelStore import LevelStore
+
+
+log = logging.getLogger('msmd.seats')
+
+
+def isInContent(levelFolder, folderName):
+    # level folders of a content folder or pack are below it (or the content itself for a single level)
+    return levelFolder == folderName or levelFolder.startswith(folderName+os.sep)
+
+
+class SharedResources(object):
+
+    def __init__(self, game, findPorts, openPort, audioEngine=None):
+        # game is the first seat, whose settings are used for everything shared
+        self.logListener = setupLogging(game.logLevel, game.logFolder, console=game.logConsole)
+        self.imageCache = PreparedImageCache(game.imageCacheSize, game.decodedImageWindow)
+        self.levelStore = LevelStore(game.levelStoreSize)
+        self.soundCache = SoundCache(game.soundCacheSize)
+        self.audioEngine = audioEngine if audioEngine is not None else AudioEngine()
+        self.numSeats = game.numSeats
+        self.seatPorts = game.seatPorts
+        self.raceServer = game.raceServer
+        self.seats = []
+        self.selections = {}  # seat -> selected content
+        self.stationSeats = {}  # port -> seat the station was given to
+        self.waitingStations = {}  # port -> base station no seat could take yet
+        self.portMonitor = PortMonitor(findPorts, game.portScanInterval, openPort)
+        self.portMonitor.stationAttached.connect(self.stationAttached)
+        self.portMonitor.stationDetached.connect(self.stationDetached)
+
+    def addSeat(self, seat):
+        self.seats.append(seat)
+        # a race server drives the base stations itself, so no port is opened here
+        if len(self.seats) == 1 and not self.raceServer:
+            self.portMonitor.start()
+        self.assignWaitingStations()
+
+    def removeSeat(self, seat):
+        # the seat's stations go to the other seats; everything stops with the last seat
+        if seat not in self.seats:
+            return
+        self.seats.remove(seat)
+        self.selections.pop(seat, None)
+        for port in [port for port, owner in self.stationSeats.items() if owner is seat]:
+            del self.stationSeats[port]
+            for baseStation in seat.robot:
+                if baseStation.port == port:
+                    self.waitingStations[port] = baseStation
+        if self.seats:
+            self.assignWaitingStations()
+            return
+        self.portMonitor.stop()
+        self.audioEngine.close()
+        for baseStation in self.waitingStations.values():
+            baseStation.close()
+        self.waitingStations = {}
+        log.info('closing')
+        self.logListener.stop()
+
+    def seatForStation(self, port):
+        if self.seatPorts:
+            for seat in self.seats:
+                if port in self.seatPorts and self.seatPorts.index(port) == seat.seatNumber:
+                    return seat
+            return None
+        if self.numSeats == 1:
+            return self.seats[0] if self.seats else None
+        for seat in self.seats:
+            if seat not in self.stationSeats.values():
+                return seat
+        return None
+
+    def stationAttached(self, port, baseStation):
+        seat = self.seatForStation(port)
+        if seat is None:
+            log.info('base station %s is waiting for a seat', port)
+            self.waitingStations[port] = baseStation
+            return
+        self.stationSeats[port] = seat
+        seat.baseStationAttached(port, baseStation)
+
+    def stationDetached(self, port):
+        baseStation = self.waitingStations.pop(port, None)
+        if baseStation is not None:
+            baseStation.close()
+            return
+        seat = self.stationSeats.pop(port, None)
+        if seat is not None:
+            seat.baseStationDetached(port)
+            self.assignWaitingStations()
+
+    def assignWaitingStations(self):
+        for port in sorted(self.waitingStations):
+            seat = self.seatForStation(port)
+            if seat is not None:
+                self.stationSeats[port] = seat
+                seat.baseStationAttached(port, self.waitingStations.pop(port))
+
+    def contentSelected(self, seat, folderName):
+        # content another seat is playing is shared as it is; otherwise its levels are
+        # loaded again, in case they changed since they were cached
+        inUse = any(content == folderName for other, content in self.selections.items() if other is not seat)
+        self.selections[seat] = folderName
+        if not inUse:
+            self.invalidateContent(folderName)
+
+    def invalidateContent(self, folderName):
+        levelFolders = set(self.levelStore.levels) | set(self.soundCache.levels) | self.imageCache.levelFolders()
+        for levelFolder in levelFolders:
+            if isInContent(levelFolder, folderName):
+                self.invalidateLevel(levelFolder)
+
+    def invalidateLevel(self, levelFolder):
+        self.levelStore.invalidateLevel(levelFolder)
+        self.imageCache.invalidateLevel(levelFolder)
+        self.soundCache.invalidateLevel(levelFolder)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Recording of the inputs of a played game into a compact session file.
+
+A session lasts from the Start button until the game returns to the home
+screen. Every itemClickedEvent/keyPressed emission of the game view is
+stored as one fixed-size binary record: when it happened, what it was (hit
+or missed click, mouse button, scancode, modifiers), the level and step it
+was meant for, how long the game took to handle it and whether it advanced
+the game. Records are kept in memory and written when the session ends.
+
+File layout:
+    header      magic, format version and metadata length (see HEADER)
+    metadata    utf-8 json (content, screen, settings the game ran with)
+    records     RECORD structs until the end of the file
+
+Sessions are played back into the game with ReplaySession.py.
+"""
+
+import os
+import json
+import time
+import struct
+import logging
+
+
+log = logging.getLogger('msmd.session')
+
+SESSION_EXTENSION = '.msmdsession'
+SESSION_MAGIC = b'MSMDSESS'
+SESSION_VERSION = 1
+HEADER = struct.Struct('<8sII')
+# time since the session start, kind, hit, outcome, mouse button, scancode,
+# keyboard modifiers, level, step, seconds spent handling the input
+RECORD = struct.Struct('<dBBBiiIHHf')
+
+# record kinds
+INPUT_MOUSE = 0
+INPUT_KEY = 1
+
+# record outcomes
+OUTCOME_NONE = 0  # wrong input, the game did not change
+OUTCOME_STEP = 1  # the next step of the level was shown
+OUTCOME_LEVEL = 2  # the level ended (level change, restart or game over)
+
+
+class SessionRecord(object):
+
+    __slots__ = ('time', 'kind', 'hit', 'outcome', 'button', 'scancode', 'modifiers', 'level', 'step', 'handled')
+
+    def __init__(self, fields):
+        (self.time, self.kind, self.hit, self.outcome, self.button, self.scancode,
+         self.modifiers, self.level, self.step, self.handled) = fields
+
+
+def readSession(fileName):
+    # returns (metadata dict, list of SessionRecords)
+    with open(fileName, 'rb') as sessionFile:
+        data = sessionFile.read()
+    if len(data) < HEADER.size:
+        raise IOError('%s is not a session file' % fileName)
+    magic, version, metadataLength = HEADER.unpack_from(data, 0)
+    if magic != SESSION_MAGIC or version != SESSION_VERSION:
+        raise IOError('%s is not a version %s session file' % (fileName, SESSION_VERSION))
+    recordStart = HEADER.size+metadataLength
+    metadata = json.loads(data[HEADER.size:recordStart].decode('utf-8'))
+    numRecords = (len(data)-recordStart)//RECORD.size
+    records = [SessionRecord(fields) for fields in RECORD.iter_unpack(data[recordStart:recordStart+numRecords*RECORD.size])]
+    return metadata, records
+
+
+class SessionRecorder(object):
+
+    def __init__(self, game, folder):
+        # game is the App whose level/step state is recorded with every input
+        self.game = game
+        self.folder = folder
+        self.metadata = None
+        self.records = bytearray()
+        self.sessionStart = 0
+        self.pending = None
+        self.ending = False
+
+    def beginSession(self, metadata):
+        self.metadata = dict(metadata, sessionStart=time.time())
+        self.records = bytearray()
+        self.sessionStart = time.perf_counter()
+        self.pending = None
+        self.ending = False
+
+    def inputReceived(self, kind, hit, button, scancode, modifiers):
+        # called by the view right before it emits the input signal
+        if self.metadata is None:
+            return
+        game = self.game
+        self.pending = (time.perf_counter(), kind, hit, button, scancode, modifiers,
+                        game.currentLevel, game.currentImageNumber, game.currentTotalImageNumber)
+
+    def inputHandled(self):
+        # called by the view once the game handled the input, or by the game
+        # when the level or game end dialog the input opened was answered
+        if self.pending is None or self.game.seatDialog is not None:
+            return
+        now = time.perf_counter()
+        received, kind, hit, button, scancode, modifiers, level, step, totalStep = self.pending
+        self.pending = None
+        game = self.game
+        if game.currentLevel == level and game.currentImageNumber == step+1:
+            outcome = OUTCOME_STEP
+        elif game.currentLevel == level and game.currentImageNumber == step and game.currentTotalImageNumber == totalStep:
+            outcome = OUTCOME_NONE
+        else:
+            outcome = OUTCOME_LEVEL
+        self.records += RECORD.pack(received-self.sessionStart, kind, hit, outcome, button, scancode,
+                                    modifiers, level, step, now-received)
+        if self.ending:
+            self.write()
+
+    def endSession(self):
+        # the game went back to the home screen; an input still being handled is written with it
+        if self.metadata is None:
+            return
+        if self.pending is not None:
+            self.ending = True
+        else:
+            self.write()
+
+    def write(self):
+        metadata = self.metadata
+        self.metadata = None
+        self.ending = False
+        if not self.records:
+            return None
+        metadataData = json.dumps(metadata).encode('utf-8')
+        fileName = os.path.join(self.folder, 'session-'+time.strftime('%Y%m%d-%H%M%S', time.localtime(metadata['sessionStart']))+SESSION_EXTENSION)
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(fileName, 'wb') as sessionFile:
+                sessionFile.write(HEADER.pack(SESSION_MAGIC, SESSION_VERSION, len(metadataData)))
+                sessionFile.write(metadataData)
+                sessionFile.write(self.records)
+        except OSError as error:
+            log.error('session could not be written to %s: %s', fileName, error)
+            return None
+        log.info('session of %s inputs written to %s', len(self.records)//RECORD.size, fileName)
+        self.records = bytearray()
+        return fileName
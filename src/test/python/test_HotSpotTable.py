@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'main', 'python'))
+pytest.importorskip('PyQt5')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QPointF  # noqa: E402
+from PyQt5.QtGui import QTransform  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+from HotSpotTable import HotSpotTable  # noqa: E402
+from GameScene import GameScene  # noqa: E402
+
+SCREEN_SIZES = [(1920, 1020), (1920, 1040), (1366, 728), (1280, 1024)]
+
+
+@pytest.fixture(scope='module')
+def application():
+    return QApplication.instance() or QApplication([])
+
+
+def baselineScreenPixel(xPosition, yPosition, screenWidth, screenHeight):
+    # where the game drew a hotspot before the view scaled the scene: in screen
+    # coordinates, over the recorded 1920x1020 area stretched to the screen
+    xScale = screenWidth/1920
+    yScale = screenHeight/1020
+    return xPosition*xScale, yPosition*yScale+30
+
+
+def test_recorded_position_is_kept():
+    table = HotSpotTable({'000000': {'type': 'mouse', 'button': 'left', 'position': [812, 431]}})
+    assert (table.x[0], table.y[0]) == (812, 431)
+
+
+def test_key_steps_have_no_position():
+    table = HotSpotTable({'000000': {'type': 'key', 'name': 'a', 'scancode': 30}})
+    assert (table.x[0], table.y[0]) == (0, 0)
+
+
+@pytest.mark.parametrize('screenWidth, screenHeight', SCREEN_SIZES)
+def test_hotspot_is_drawn_at_the_baseline_screen_pixel(application, screenWidth, screenHeight):
+    table = HotSpotTable({'000000': {'type': 'mouse', 'button': 'left', 'position': [812, 431]}})
+    view = QTransform.fromScale(screenWidth/1920, screenHeight/1020)
+    scene = GameScene()
+    scene.setViewScale(view.m22())
+    scene.showHotSpot(table.x[0], table.y[0], 50, table.buttonNames[0])
+    center = view.map(scene.hotSpot.rect().center())
+    assert (center.x(), center.y()) == pytest.approx(baselineScreenPixel(812, 431, screenWidth, screenHeight))
+
+
+@pytest.mark.parametrize('screenWidth, screenHeight', SCREEN_SIZES)
+def test_click_on_the_baseline_screen_pixel_hits(application, screenWidth, screenHeight):
+    view = QTransform.fromScale(screenWidth/1920, screenHeight/1020)
+    scene = GameScene()
+    # the hotspot is shown first and the view scaled afterwards, like on a window resize
+    scene.showHotSpot(812, 431, 50, 'left')
+    scene.setViewScale(view.m22())
+    click = view.inverted()[0].map(QPointF(*baselineScreenPixel(812, 431, screenWidth, screenHeight)))
+    assert scene.hotSpotAt(click) is scene.hotSpot
+    # a click 60 screen pixels higher is outside the circle
+    assert scene.hotSpotAt(QPointF(click.x(), click.y()-60/view.m22())) is None